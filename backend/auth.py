@@ -4,13 +4,16 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 import os
 
-from database import get_db
+from database import AsyncSessionLocal, get_async_db
+from last_seen import last_seen_buffer
 from models import User
-from schemas import TokenData
+from password_pool import PASSWORD_HASH_RETRY_AFTER, PasswordPoolBusy, password_pool
+from principal_cache import Principal, principal_cache
 
 load_dotenv()
 
@@ -27,6 +30,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def run_password_job(fn, *args):
+    # bcrypt takes 100+ ms; run it on password_pool so the event loop keeps serving sockets
+    try:
+        return await password_pool.run(fn, *args)
+    except PasswordPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-ins in progress, try again shortly",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+        )
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -37,18 +51,52 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await run_password_job(verify_password, password, user.hashed_password):
         return False
     return user
 
+async def principal_from_token(token: str, db: Optional[AsyncSession] = None) -> Optional[Principal]:
+    # None if the token is invalid or its user no longer exists. Served from
+    # principal_cache when possible; db (or a short-lived session) only on a miss
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+
+    generation = principal_cache.generation
+    if db is None:
+        async with AsyncSessionLocal() as session:
+            user = await _load_user(session, username, payload.get("uid"))
+    else:
+        user = await _load_user(db, username, payload.get("uid"))
+    if user is None:
+        return None
+    return principal_cache.set(user, generation)
+
+async def _load_user(db: AsyncSession, username: str, user_id: Optional[int]) -> Optional[User]:
+    # Tokens issued since the uid claim was added look up by primary key
+    if user_id is not None:
+        user = await db.get(User, user_id)
+        return user if user is not None and user.username == username else None
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -59,21 +107,12 @@ async def get_current_user(
     if token is None:
         raise credentials_exception
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == token_data.username).first()
+    user = await principal_from_token(token, db)
     if user is None:
         raise credentials_exception
     
-    # Update last_seen
+    # Recorded in memory and written in bulk by last_seen_buffer, so reads stay read-only
     user.last_seen = datetime.utcnow()
-    db.commit()
+    last_seen_buffer.touch(user.id, user.last_seen)
     
     return user
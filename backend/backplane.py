@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Empty -> in-process (single worker). redis://[:password@]host:port -> shared across workers
+BACKPLANE_URL = os.getenv("WS_BACKPLANE_URL", "")
+BACKPLANE_CHANNEL = os.getenv("WS_BACKPLANE_CHANNEL", "webchat:ws")
+
+# Envelope handler installed by ConnectionManager
+EnvelopeHandler = Callable[[dict], None]
+
+
+def _dumps(envelope: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(envelope)
+    return json.dumps(envelope, separators=(",", ":")).encode()
+
+
+def _loads(data: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Backplane(ABC):
+    """Pub/sub transport that carries WebSocket deliveries between workers.
+
+    Every worker publishes the envelopes it delivers locally and receives the
+    envelopes of all other workers through the handler passed to start().
+    """
+
+    @abstractmethod
+    async def start(self, handler: EnvelopeHandler):
+        ...
+
+    @abstractmethod
+    async def publish(self, envelope: dict):
+        ...
+
+    @abstractmethod
+    async def stop(self):
+        ...
+
+
+class InProcessBackplane(Backplane):
+    # Workers (ConnectionManagers) sharing one process; with a single manager
+    # publish is a no-op since local delivery already happened.
+    _handlers: List[EnvelopeHandler] = []
+
+    def __init__(self):
+        self.handler: Optional[EnvelopeHandler] = None
+
+    async def start(self, handler: EnvelopeHandler):
+        self.handler = handler
+        InProcessBackplane._handlers.append(handler)
+
+    async def publish(self, envelope: dict):
+        for handler in InProcessBackplane._handlers:
+            if handler is not self.handler:
+                handler(envelope)
+
+    async def stop(self):
+        if self.handler in InProcessBackplane._handlers:
+            InProcessBackplane._handlers.remove(self.handler)
+        self.handler = None
+
+
+def _encode_command(*args: bytes) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(out)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("backplane connection closed")
+    prefix, rest = line[:1], line[1:-2]
+    if prefix == b"+":
+        return rest
+    if prefix == b"-":
+        raise ConnectionError(rest.decode())
+    if prefix == b":":
+        return int(rest)
+    if prefix == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        return [await _read_reply(reader) for _ in range(int(rest))]
+    raise ConnectionError(f"unexpected reply: {line!r}")
+
+
+class RedisBackplane(Backplane):
+    """Redis pub/sub over the RESP protocol (no client library needed).
+
+    Uses one connection for SUBSCRIBE and one for PUBLISH. Publishes are queued
+    and pipelined by a writer task so broadcasts never wait on the network.
+    """
+
+    def __init__(self, url: str, channel: str = BACKPLANE_CHANNEL):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.channel = channel.encode()
+        self.handler: Optional[EnvelopeHandler] = None
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=10000)
+        self.tasks: List[asyncio.Task] = []
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(_encode_command(b"AUTH", self.password.encode()))
+            await writer.drain()
+            await _read_reply(reader)
+        return reader, writer
+
+    async def start(self, handler: EnvelopeHandler):
+        self.handler = handler
+        self.tasks = [
+            asyncio.create_task(self._subscribe_loop()),
+            asyncio.create_task(self._publish_loop()),
+        ]
+
+    async def publish(self, envelope: dict):
+        try:
+            self.outbox.put_nowait(_dumps(envelope))
+        except asyncio.QueueFull:
+            print("Backplane outbox full, dropping envelope")
+
+    async def _subscribe_loop(self):
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._open()
+                writer.write(_encode_command(b"SUBSCRIBE", self.channel))
+                await writer.drain()
+                while True:
+                    reply = await _read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        try:
+                            self.handler(_loads(reply[2]))
+                        except Exception as e:
+                            print(f"Backplane handler error: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Backplane subscriber disconnected: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    async def _publish_loop(self):
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._open()
+                while True:
+                    batch = [await self.outbox.get()]
+                    while not self.outbox.empty() and len(batch) < 256:
+                        batch.append(self.outbox.get_nowait())
+                    writer.write(b"".join(
+                        _encode_command(b"PUBLISH", self.channel, payload) for payload in batch
+                    ))
+                    await writer.drain()
+                    for _ in batch:
+                        await _read_reply(reader)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Backplane publisher disconnected: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+def create_backplane(url: str = BACKPLANE_URL) -> Backplane:
+    if url.startswith("redis://"):
+        return RedisBackplane(url)
+    return InProcessBackplane()
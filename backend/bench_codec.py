@@ -0,0 +1,118 @@
+"""Micro-benchmark: bytes on the wire and CPU per frame for the /ws/chat encodings.
+
+Compares JSON text frames with the msgpack subprotocol, each with and without
+permessage-deflate. Deflate is modelled the way the websockets server applies
+it by default: raw deflate with context takeover, sync-flushed per frame and
+the trailing 00 00 ff ff stripped.
+
+    python bench_codec.py [--frames 5000]
+"""
+import argparse
+import random
+import time
+import zlib
+from datetime import datetime
+
+from ws_codec import Frame, decode, msgpack
+
+if msgpack is None:
+    raise SystemExit("msgpack is not installed")
+
+
+WORDS = ("the release plan for next week looks fine but we still need to check "
+         "staging numbers and call the vendor about invoices before friday lunch").split()
+
+
+def sample_frames(count: int):
+    # Rough mix of what a busy client receives
+    rng = random.Random(1)
+    now = datetime.utcnow().isoformat()
+    frames = []
+    for i in range(count):
+        kind = i % 10
+        if kind < 6:
+            frames.append({
+                "type": "new_message",
+                "message": {
+                    "id": 100000 + i,
+                    "content": " ".join(rng.choices(WORDS, k=rng.randint(3, 25))),
+                    "sender_id": rng.randint(1, 5000),
+                    "room_id": rng.randint(1, 500),
+                    "message_type": "text",
+                    "created_at": now,
+                    "sender": {"id": 42, "username": f"user{i}", "display_name": f"User {i}", "avatar_url": None},
+                },
+                "correlation_id": None,
+            })
+        elif kind < 8:
+            frames.append({"type": "user_status", "user_id": i, "status": "online", "last_seen": now})
+        elif kind == 8:
+            frames.append({"type": "read_up_to", "room_id": 7, "user_id": 43, "message_id": 100000 + i, "read_at": now})
+        else:
+            frames.append({
+                "type": "ice_candidate",
+                "sender_id": 42,
+                "candidate": {
+                    "candidate": f"candidate:{i} 1 udp 2122260223 192.168.1.{i % 255} 54321 typ host generation 0",
+                    "sdpMid": "0",
+                    "sdpMLineIndex": 0,
+                },
+            })
+    return frames
+
+
+def deflate_sizes(payloads):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    total = 0
+    started = time.perf_counter()
+    for payload in payloads:
+        data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        total += len(data) - 4
+    return total, time.perf_counter() - started
+
+
+def run(frames: int):
+    messages = sample_frames(frames)
+
+    started = time.perf_counter()
+    json_frames = [Frame(m).json for m in messages]
+    json_encode = time.perf_counter() - started
+
+    started = time.perf_counter()
+    msgpack_frames = [Frame(m).msgpack for m in messages]
+    msgpack_encode = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for text in json_frames:
+        decode(text)
+    json_decode = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for data in msgpack_frames:
+        decode(data)
+    msgpack_decode = time.perf_counter() - started
+
+    json_bytes = sum(len(text.encode()) for text in json_frames)
+    msgpack_bytes = sum(len(data) for data in msgpack_frames)
+    json_deflated, json_deflate_time = deflate_sizes([text.encode() for text in json_frames])
+    msgpack_deflated, msgpack_deflate_time = deflate_sizes(msgpack_frames)
+
+    per_frame = lambda seconds: seconds / frames * 1e6
+    print(f"{frames} frames")
+    print(f"{'encoding':<20}{'bytes/frame':>12}{'encode us':>12}{'decode us':>12}{'deflate us':>12}")
+    rows = [
+        ("json", json_bytes, json_encode, json_decode, 0.0),
+        ("msgpack", msgpack_bytes, msgpack_encode, msgpack_decode, 0.0),
+        ("json + deflate", json_deflated, json_encode, json_decode, json_deflate_time),
+        ("msgpack + deflate", msgpack_deflated, msgpack_encode, msgpack_decode, msgpack_deflate_time),
+    ]
+    for name, size, encode, decode_time, deflate in rows:
+        print(f"{name:<20}{size / frames:>12.1f}{per_frame(encode):>12.2f}"
+              f"{per_frame(decode_time):>12.2f}{per_frame(deflate):>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=5000)
+    args = parser.parse_args()
+    run(args.frames)
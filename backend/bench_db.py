@@ -0,0 +1,129 @@
+"""Benchmark: concurrent read/write throughput for each database engine profile.
+
+Readers run the room-history query (GET /api/messages), writers insert a
+message and commit, all at once for a fixed time, against a fresh schema
+per profile. "basic" is the engine as it was before profiles (driver
+defaults, NullPool and rollback journal on SQLite).
+
+    python bench_db.py [--readers 16] [--writers 1] [--seconds 10]
+    python bench_db.py --url postgresql://user:pw@localhost/bench_webchat
+
+One writer matches the server, where chat inserts go through message_writer.
+The SQLite runs use a scratch file; a --url database has the tables dropped
+and recreated, so point it at a throwaway database.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from database import Base, _async_url, build_async_engine, build_engine
+from models import Message, Room, RoomMember, RoomType, User
+
+SEED_MESSAGES = 5000
+
+
+def seed(url: str, profile: str) -> int:
+    sync_engine = build_engine(url, profile)
+    Base.metadata.drop_all(bind=sync_engine)
+    Base.metadata.create_all(bind=sync_engine)
+    with sync_engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "username": f"bench{i}", "email": f"bench{i}@example.com", "hashed_password": "x",
+             "is_active": True, "created_at": datetime.utcnow(), "last_seen": datetime.utcnow()}
+            for i in range(1, 11)
+        ])
+        conn.execute(Room.__table__.insert(), [{"id": 1, "type": RoomType.GROUP.value, "name": "bench", "created_by": 1,
+                                                "created_at": datetime.utcnow()}])
+        conn.execute(RoomMember.__table__.insert(), [{"room_id": 1, "user_id": i, "role": "member",
+                                                      "joined_at": datetime.utcnow()} for i in range(1, 11)])
+        conn.execute(Message.__table__.insert(), [
+            {"room_id": 1, "sender_id": i % 10 + 1, "content": f"seed message {i}", "created_at": datetime.utcnow(),
+             "is_edited": False, "is_deleted": False}
+            for i in range(SEED_MESSAGES)
+        ])
+    sync_engine.dispose()
+    return 1
+
+
+async def reader(sessions, room_id: int, deadline: float, stats: dict):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with sessions() as db:
+                result = await db.execute(
+                    select(Message).where(Message.room_id == room_id, Message.is_deleted == False)
+                    .options(selectinload(Message.sender), selectinload(Message.attachments))
+                    .order_by(Message.created_at.desc()).limit(50)
+                )
+                result.scalars().all()
+            stats["reads"] += 1
+            stats["read_latency"].append(time.perf_counter() - start)
+        except Exception as e:
+            stats["errors"][type(e).__name__] = stats["errors"].get(type(e).__name__, 0) + 1
+
+
+async def writer(sessions, room_id: int, sender_id: int, deadline: float, stats: dict):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with sessions() as db:
+                db.add(Message(room_id=room_id, sender_id=sender_id, content="bench write"))
+                await db.commit()
+            stats["writes"] += 1
+            stats["write_latency"].append(time.perf_counter() - start)
+        except Exception as e:
+            stats["errors"][type(e).__name__] = stats["errors"].get(type(e).__name__, 0) + 1
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+async def run_profile(url: str, profile: str, readers: int, writers: int, seconds: float):
+    room_id = seed(url, profile)
+    engine = build_async_engine(_async_url(url), profile)
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    stats = {"reads": 0, "writes": 0, "read_latency": [], "write_latency": [], "errors": {}}
+
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(
+        *[reader(sessions, room_id, deadline, stats) for _ in range(readers)],
+        *[writer(sessions, room_id, i % 10 + 1, deadline, stats) for i in range(writers)],
+    )
+    await engine.dispose()
+
+    print(f"{profile:<11} reads/s {stats['reads'] / seconds:8.1f} (p99 {percentile(stats['read_latency'], 0.99):7.1f} ms)"
+          f"   writes/s {stats['writes'] / seconds:7.1f} (p99 {percentile(stats['write_latency'], 0.99):7.1f} ms)"
+          f"   errors {stats['errors'] or 0}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--url", help="Throwaway database to benchmark instead of a scratch SQLite file")
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:.0f} s per profile, {os.cpu_count()} CPUs")
+    if args.url:
+        runs = [(args.url, "basic"), (args.url, "auto")]
+    else:
+        scratch = tempfile.mkdtemp(prefix="bench_db_")
+        runs = [(f"sqlite:///{scratch}/{profile}.db", profile) for profile in ("basic", "sqlite-wal")]
+    for url, profile in runs:
+        asyncio.run(run_profile(url, profile, args.readers, args.writers, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
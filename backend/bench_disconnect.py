@@ -0,0 +1,83 @@
+"""Micro-benchmark: cost of one disconnect with many live rooms on the server.
+
+Compares the old full scan over room_subscribers with ConnectionRegistry,
+which only touches the rooms of the disconnecting user.
+
+    python bench_disconnect.py [--rooms 100000] [--user-rooms 20] [--runs 200]
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, Set
+
+from connections import Connection, ConnectionRegistry
+
+
+class FakeWebSocket:
+    pass
+
+
+def legacy_disconnect(room_subscribers: Dict[int, Set[int]], user_id: int):
+    # Pre-registry ConnectionManager.disconnect cleanup
+    for room_id in list(room_subscribers.keys()):
+        if user_id in room_subscribers[room_id]:
+            room_subscribers[room_id].discard(user_id)
+            if not room_subscribers[room_id]:
+                del room_subscribers[room_id]
+
+
+def populate(rooms: int):
+    # One background user per room keeps every room alive
+    registry = ConnectionRegistry()
+    legacy: Dict[int, Set[int]] = {}
+    for room_id in range(rooms):
+        registry.join(room_id, room_id)
+        legacy[room_id] = {room_id}
+    return registry, legacy
+
+
+def join_test_user(registry, legacy, user_id: int, rooms: int, user_rooms: int):
+    # Users under test (ids >= rooms) join rooms spread across the key space
+    step = max(1, rooms // user_rooms)
+    for room_id in range(0, rooms, step)[:user_rooms]:
+        registry.join(room_id, user_id)
+        legacy[room_id].add(user_id)
+    connection = Connection(FakeWebSocket(), user_id)
+    registry.add(connection)
+    return connection
+
+
+async def run(rooms: int, user_rooms: int, runs: int):
+    registry, legacy = populate(rooms)
+
+    legacy_total = 0.0
+    registry_total = 0.0
+    for i in range(runs):
+        user_id = rooms + i
+        connection = join_test_user(registry, legacy, user_id, rooms, user_rooms)
+
+        start = time.perf_counter()
+        legacy_disconnect(legacy, user_id)
+        legacy_total += time.perf_counter() - start
+
+        start = time.perf_counter()
+        registry.remove(connection)
+        registry_total += time.perf_counter() - start
+
+        assert not registry.rooms_of(user_id)
+
+    legacy_us = legacy_total / runs * 1e6
+    registry_us = registry_total / runs * 1e6
+    print(f"rooms={rooms} user_rooms={user_rooms} runs={runs}")
+    print(f"  legacy scan  : {legacy_us:10.1f} us/disconnect")
+    print(f"  registry     : {registry_us:10.1f} us/disconnect")
+    print(f"  speedup      : {legacy_us / registry_us:10.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=100_000)
+    parser.add_argument("--user-rooms", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.rooms, args.user_rooms, args.runs))
@@ -0,0 +1,113 @@
+"""Benchmark: event-loop latency while a burst of logins is being verified.
+
+Runs the real /auth/login route in-process against a scratch SQLite database
+while a probe task measures how late a 5 ms timer fires (what every WebSocket
+on the worker would see). Compares bcrypt verified inline on the loop, as the
+route used to do, with verification on password_pool.
+
+    python bench_login.py [--logins 50] [--workers 4]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+_scratch = tempfile.mkdtemp(prefix="bench_login_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch}/bench.db"
+
+import httpx
+
+import auth
+from database import AsyncSessionLocal, Base, async_engine, engine
+from models import User
+from password_pool import PasswordPool
+
+PASSWORD = "correct horse battery staple"
+PROBE_INTERVAL = 0.005
+
+
+async def seed(users: int):
+    Base.metadata.create_all(bind=engine)
+    hashed = auth.get_password_hash(PASSWORD)
+    async with AsyncSessionLocal() as db:
+        for i in range(users):
+            db.add(User(username=f"bench{i}", email=f"bench{i}@example.com", hashed_password=hashed))
+        await db.commit()
+
+
+async def probe(lags: list, done: asyncio.Event):
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def burst(client: httpx.AsyncClient, logins: int):
+    lags: list = []
+    done = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, done))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+
+    start = time.perf_counter()
+    responses = await asyncio.gather(*[
+        client.post("/auth/login", json={"username": f"bench{i}", "password": PASSWORD})
+        for i in range(logins)
+    ])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+
+    statuses = {}
+    for response in responses:
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return elapsed, lags, statuses
+
+
+def report(label: str, elapsed: float, lags: list, statuses: dict):
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+    print(f"{label:<8} burst {elapsed * 1000:8.0f} ms   loop lag p50 {statistics.median(lags_ms):7.1f} ms"
+          f"   p99 {p99:7.1f} ms   max {lags_ms[-1]:7.1f} ms   samples {len(lags_ms):4d}   status {statuses}")
+
+
+async def run(logins: int, workers: int):
+    from main import app
+
+    await seed(logins)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up the route and the connection pool
+        await client.post("/auth/login", json={"username": "bench0", "password": PASSWORD})
+
+        pool = auth.password_pool
+
+        class InlinePool:
+            # What the route did before: bcrypt on the event loop
+            async def run(self, fn, *args):
+                return fn(*args)
+
+        auth.password_pool = InlinePool()
+        report("inline", *await burst(client, logins))
+
+        auth.password_pool = PasswordPool(workers=workers, max_pending=max(logins, 1))
+        report("pool", *await burst(client, logins))
+        auth.password_pool.stop()
+        auth.password_pool = pool
+    # Pooled aiosqlite connections run on threads that would keep the process alive
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    print(f"{args.logins} concurrent logins, {args.workers} hash workers, {os.cpu_count()} CPUs, python {sys.version.split()[0]}")
+    asyncio.run(run(args.logins, args.workers))
+
+
+if __name__ == "__main__":
+    main()
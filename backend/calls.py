@@ -0,0 +1,90 @@
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Unanswered offers older than this are forgotten
+CALL_RING_TIMEOUT = float(os.getenv("CALL_RING_TIMEOUT_SECONDS", "60"))
+
+
+class CallSession:
+    __slots__ = ("caller_id", "callee_id", "caller_session", "callee_session", "started")
+
+    def __init__(self, caller_id: int, callee_id: int, caller_session: str):
+        self.caller_id = caller_id
+        self.callee_id = callee_id
+        self.caller_session = caller_session
+        # Unknown until one of the callee's sockets answers; until then it rings everywhere
+        self.callee_session: Optional[str] = None
+        self.started = time.monotonic()
+
+
+class CallRegistry:
+    """Active 1:1 calls and the socket (connection id) each side is using.
+
+    The caller's socket is the one that sent call_offer, the callee's the one
+    that sent call_answer, so later signaling reaches only those two sockets.
+    Changes are replicated to the other workers over the backplane.
+    """
+
+    def __init__(self, manager, ring_timeout: float = CALL_RING_TIMEOUT):
+        self.manager = manager
+        self.ring_timeout = ring_timeout
+        # (lower user id, higher user id) -> call
+        self.calls: Dict[Tuple[int, int], CallSession] = {}
+        manager.register_envelope_handler("call", self._on_remote_call)
+
+    async def offer(self, caller_id: int, caller_session: str, callee_id: int):
+        await self._update(action="offer", caller_id=caller_id, callee_id=callee_id, session=caller_session)
+
+    async def answer(self, callee_id: int, callee_session: str, caller_id: int):
+        await self._update(action="answer", caller_id=caller_id, callee_id=callee_id, session=callee_session)
+
+    async def end(self, user_id: int, peer_id: int):
+        await self._update(action="end", caller_id=user_id, callee_id=peer_id, session=None)
+
+    async def drop_session(self, session_id: str):
+        # A socket went away: its calls can no longer be routed to it
+        for key, call in list(self.calls.items()):
+            if session_id in (call.caller_session, call.callee_session):
+                await self.end(*key)
+
+    def peer_session(self, sender_id: int, target_id: int) -> Optional[str]:
+        # The target's socket in its call with the sender, if pinned
+        call = self.calls.get(_key(sender_id, target_id))
+        if call is None:
+            return None
+        return call.caller_session if target_id == call.caller_id else call.callee_session
+
+    async def _update(self, **event):
+        self._apply(event)
+        await self.manager.publish_event("call", **event)
+
+    def _on_remote_call(self, envelope: dict):
+        self._apply(envelope)
+
+    def _apply(self, event: dict):
+        key = _key(event["caller_id"], event["callee_id"])
+        action = event["action"]
+        if action == "offer":
+            self._expire()
+            self.calls[key] = CallSession(event["caller_id"], event["callee_id"], event["session"])
+        elif action == "answer":
+            call = self.calls.get(key)
+            if call is not None and call.callee_id == event["callee_id"]:
+                call.callee_session = event["session"]
+        elif action == "end":
+            self.calls.pop(key, None)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ring_timeout
+        for key, call in list(self.calls.items()):
+            if call.callee_session is None and call.started < cutoff:
+                del self.calls[key]
+
+
+def _key(a: int, b: int) -> Tuple[int, int]:
+    return (a, b) if a < b else (b, a)
@@ -0,0 +1,223 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+from fastapi import WebSocket
+from dotenv import load_dotenv
+
+from metrics import counter
+from ws_codec import Frame, JSON
+
+load_dotenv()
+
+# Max frames buffered per socket before the client counts as a slow consumer
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# Separate, smaller lane for call signaling; always drained before the normal queue
+PRIORITY_QUEUE_SIZE = int(os.getenv("WS_PRIORITY_QUEUE_SIZE", "64"))
+
+# What happens to a slow consumer whose queue is full:
+#   "disconnect" - close the socket (1013 Try Again Later); the client reconnects and resyncs
+#   "drop"       - discard the frame and keep the socket open
+SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "disconnect")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Sockets idle (no inbound frame) for a heartbeat interval get a heartbeat frame;
+# after WS_HEARTBEAT_MAX_MISSED intervals without an answer they are evicted
+HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))
+HEARTBEAT_MAX_MISSED = int(os.getenv("WS_HEARTBEAT_MAX_MISSED", "3"))
+HEARTBEAT_CLOSE_CODE = 1001
+# Consecutive failed sends before the writer gives up on a socket
+MAX_SEND_FAILURES = int(os.getenv("WS_MAX_SEND_FAILURES", "3"))
+
+SEND_FAILURES = counter("webchat_ws_send_failures_total", "Failed WebSocket sends")
+DROPPED_FRAMES = counter("webchat_ws_dropped_frames_total", "Frames not queued because a send queue was full", ("lane",))
+
+
+def encode_frame(message: dict) -> Frame:
+    # One Frame per broadcast, queued for every recipient; each wire format is serialized once
+    return Frame(message)
+
+
+class Connection:
+    """One client socket with its own bounded outbound queue and writer task.
+
+    Senders only enqueue; the writer task is the only coroutine that awaits the
+    socket, so a slow client never blocks delivery to anyone else. Priority
+    frames (call signaling) go to their own lane and overtake queued chat
+    traffic.
+    """
+
+    __slots__ = ("id", "websocket", "user_id", "codec", "queue", "priority_queue", "queue_size",
+                 "ready", "writer", "closed", "closing", "dropped_frames", "send_failures", "last_activity")
+
+    def __init__(self, websocket: WebSocket, user_id: int, queue_size: int = SEND_QUEUE_SIZE, codec=JSON):
+        # Globally unique, so a call can be pinned to this socket from any worker
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.user_id = user_id
+        # Wire format negotiated via the WebSocket subprotocol (see ws_codec)
+        self.codec = codec
+        self.queue: deque = deque()
+        self.priority_queue: deque = deque()
+        self.queue_size = queue_size
+        self.ready = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.closing = False
+        self.dropped_frames = 0
+        self.send_failures = 0
+        self.last_activity = time.monotonic()
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def touch(self):
+        # Called for every inbound frame; the heartbeat sweeper reads it
+        self.last_activity = time.monotonic()
+
+    def send(self, message: dict, priority: bool = False) -> bool:
+        return self.send_frame(encode_frame(message), priority)
+
+    def send_frame(self, frame: Frame, priority: bool = False) -> bool:
+        # Non-blocking; returns False if the frame could not be queued
+        if self.closed:
+            return False
+        if priority:
+            queue, limit = self.priority_queue, PRIORITY_QUEUE_SIZE
+        else:
+            queue, limit = self.queue, self.queue_size
+        if len(queue) >= limit:
+            self.dropped_frames += 1
+            DROPPED_FRAMES.inc(1, ("priority" if priority else "normal",))
+            return False
+        queue.append(frame)
+        self.ready.set()
+        return True
+
+    async def _write_loop(self):
+        while True:
+            if self.priority_queue:
+                frame = self.priority_queue.popleft()
+            elif self.queue:
+                frame = self.queue.popleft()
+            else:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            try:
+                await self.codec.send(self.websocket, frame)
+                self.send_failures = 0
+            except Exception:
+                self.send_failures += 1
+                SEND_FAILURES.inc()
+                if self.send_failures >= MAX_SEND_FAILURES:
+                    break
+        # Socket is gone (maybe half-open, so the receive loop may never notice);
+        # the heartbeat sweeper evicts it from the registry
+        self.closed = True
+
+    def stop(self):
+        # Stop the writer without touching the socket (normal disconnect path)
+        self.closed = True
+        if self.writer and not self.writer.done():
+            self.writer.cancel()
+
+    def close(self, code: int = 1000):
+        # Stop the writer and close the socket from the server side
+        if self.closing:
+            return
+        self.closing = True
+        self.stop()
+        asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class ConnectionRegistry:
+    """Live sockets and room subscriptions, indexed both ways.
+
+    room_subscribers (room -> users) serves fan-out; user_rooms (user -> rooms)
+    lets disconnect/leave touch only the rooms of that user instead of scanning
+    every room on the server.
+    """
+
+    def __init__(self):
+        self.connections: Dict[int, List[Connection]] = {}
+        self.by_id: Dict[str, Connection] = {}
+        self.room_subscribers: Dict[int, Set[int]] = {}
+        self.user_rooms: Dict[int, Set[int]] = {}
+
+    def add(self, connection: Connection):
+        self.connections.setdefault(connection.user_id, []).append(connection)
+        self.by_id[connection.id] = connection
+
+    def find(self, websocket: WebSocket, user_id: int) -> Optional[Connection]:
+        for connection in self.connections.get(user_id, ()):
+            if connection.websocket is websocket:
+                return connection
+        return None
+
+    def remove(self, connection: Connection) -> bool:
+        # Returns True when this was the user's last live connection
+        self.by_id.pop(connection.id, None)
+        user_connections = self.connections.get(connection.user_id)
+        if user_connections is None:
+            return False
+        if connection in user_connections:
+            user_connections.remove(connection)
+        if user_connections:
+            return False
+        del self.connections[connection.user_id]
+        # Subscriptions are per user, so they go with the last connection
+        self.drop_user(connection.user_id)
+        return True
+
+    def all_connections(self) -> List[Connection]:
+        return list(self.by_id.values())
+
+    def get(self, connection_id: str) -> Optional[Connection]:
+        return self.by_id.get(connection_id)
+
+    def user_connections(self, user_id: int) -> List[Connection]:
+        return self.connections.get(user_id, [])
+
+    def is_online(self, user_id: int) -> bool:
+        return user_id in self.connections
+
+    def join(self, room_id: int, user_id: int):
+        self.room_subscribers.setdefault(room_id, set()).add(user_id)
+        self.user_rooms.setdefault(user_id, set()).add(room_id)
+
+    def leave(self, room_id: int, user_id: int):
+        subscribers = self.room_subscribers.get(room_id)
+        if subscribers is not None:
+            subscribers.discard(user_id)
+            if not subscribers:
+                del self.room_subscribers[room_id]
+        rooms = self.user_rooms.get(user_id)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self.user_rooms[user_id]
+
+    def drop_user(self, user_id: int):
+        # O(rooms of this user)
+        for room_id in self.user_rooms.pop(user_id, ()):
+            subscribers = self.room_subscribers.get(room_id)
+            if subscribers is not None:
+                subscribers.discard(user_id)
+                if not subscribers:
+                    del self.room_subscribers[room_id]
+
+    def rooms_of(self, user_id: int) -> Set[int]:
+        return self.user_rooms.get(user_id, set())
+
+    def subscribers(self, room_id: int) -> Set[int]:
+        return self.room_subscribers.get(room_id, set())
@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 import os
 
@@ -8,17 +10,115 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./webchat.db")
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def _async_url(url: str) -> str:
+    # Same database through an asyncio driver (aiosqlite / asyncpg)
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
 
-# Enable foreign keys for SQLite
-if "sqlite" in DATABASE_URL:
-    from sqlalchemy import event
-    def _fk_pragma_on_connect(dbapi_con, con_record):
-        dbapi_con.execute('pragma foreign_keys=ON')
-    event.listen(engine, 'connect', _fk_pragma_on_connect)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+# Optional replica (or second pool) for read-only endpoints: history, room lists, search
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+ASYNC_DATABASE_READ_URL = os.getenv("ASYNC_DATABASE_READ_URL", _async_url(DATABASE_READ_URL) if DATABASE_READ_URL else None)
+
+# Engine profile: "auto" picks sqlite-wal or postgres from the URL; "basic" is
+# driver defaults with only foreign keys enabled on SQLite
+DB_PROFILE = os.getenv("DB_PROFILE", "auto")
+
+SQLITE_PRAGMAS = {
+    # Readers no longer block the writer (and vice versa); the WAL is durable
+    # at checkpoint, and synchronous=NORMAL only risks the last commits on power loss
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Wait for a lock instead of failing with "database is locked"
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    # Negative means KiB: page cache per connection
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+PROFILES = {
+    "basic": {"pragmas": {}, "engine": {}},
+    # aiosqlite otherwise defaults to NullPool: a new connection (and pragma round) per session
+    "sqlite-wal": {
+        "pragmas": SQLITE_PRAGMAS,
+        "engine": {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        },
+    },
+    "postgres": {
+        "pragmas": {},
+        "engine": {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            # Connections outliving server-side idle timeouts or failovers are replaced, not handed out
+            "pool_pre_ping": True,
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        },
+    },
+}
+
+def resolve_profile(url: str, profile: str = DB_PROFILE) -> str:
+    if profile == "auto":
+        if url.startswith("sqlite"):
+            # In-memory databases are per connection; pooling or WAL would break them
+            return "basic" if url.endswith(("://", ":memory:")) else "sqlite-wal"
+        return "postgres"
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}; expected auto or one of {', '.join(PROFILES)}")
+    return profile
+
+def _sqlite_pragmas(pragmas: dict):
+    def on_connect(dbapi_con, con_record):
+        cursor = dbapi_con.cursor()
+        cursor.execute('pragma foreign_keys=ON')
+        for name, value in pragmas.items():
+            cursor.execute(f'pragma {name}={value}')
+        cursor.close()
+    return on_connect
+
+def _configure(sync_engine, url: str, profile: str):
+    if url.startswith("sqlite"):
+        event.listen(sync_engine, 'connect', _sqlite_pragmas(PROFILES[profile]["pragmas"]))
+
+def build_engine(url: str, profile: str = DB_PROFILE):
+    profile = resolve_profile(url, profile)
+    options = dict(PROFILES[profile]["engine"])
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    new_engine = create_engine(url, **options)
+    _configure(new_engine, url, profile)
+    return new_engine
+
+def build_async_engine(url: str, profile: str = DB_PROFILE):
+    profile = resolve_profile(url, profile)
+    options = dict(PROFILES[profile]["engine"])
+    if url.startswith("sqlite") and options:
+        options["poolclass"] = AsyncAdaptedQueuePool
+    new_engine = create_async_engine(url, **options)
+    _configure(new_engine.sync_engine, url, profile)
+    return new_engine
+
+engine = build_engine(DATABASE_URL)
+
+# Async engine used by the routers and the WebSocket layer
+async_engine = build_async_engine(ASYNC_DATABASE_URL)
+# Same engine unless DATABASE_READ_URL points somewhere else
+async_read_engine = build_async_engine(ASYNC_DATABASE_READ_URL) if ASYNC_DATABASE_READ_URL else async_engine
+
+# Sync sessions remain for scripts and schema setup
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Short-lived async sessions; objects stay readable after commit
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -28,3 +128,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    # Read-only endpoints; may lag writes by the replica's replication delay
+    async with AsyncReadSessionLocal() as db:
+        yield db
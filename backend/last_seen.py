@@ -0,0 +1,93 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, update
+
+from database import AsyncSessionLocal
+from models import User
+
+load_dotenv()
+
+LAST_SEEN_FLUSH_SECONDS = float(os.getenv("LAST_SEEN_FLUSH_SECONDS", "5"))
+
+
+class LastSeenBuffer:
+    """Coalesces users.last_seen / is_active writes.
+
+    Authenticated requests and presence changes only record the newest value
+    per user in memory; a background task writes everything pending in one
+    bulk UPDATE per interval, and stop() does a final flush on shutdown.
+    """
+
+    def __init__(self, interval: float = LAST_SEEN_FLUSH_SECONDS):
+        self.interval = interval
+        # user_id -> newest last_seen
+        self.seen: Dict[int, datetime] = {}
+        # user_id -> (is_active, last_seen) from WebSocket presence
+        self.status: Dict[int, Tuple[bool, datetime]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+    def touch(self, user_id: int, when: datetime = None):
+        when = when or datetime.utcnow()
+        current = self.seen.get(user_id)
+        if current is None or when > current:
+            self.seen[user_id] = when
+
+    def set_status(self, user_id: int, is_active: bool, when: datetime):
+        # Latest transition wins; it also carries last_seen
+        self.status[user_id] = (is_active, when)
+        self.seen.pop(user_id, None)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"last_seen flush failed: {e}")
+
+    async def flush(self):
+        if not self.seen and not self.status:
+            return
+        seen, self.seen = self.seen, {}
+        status, self.status = self.status, {}
+
+        table = User.__table__
+        async with AsyncSessionLocal() as db:
+            if status:
+                await db.execute(
+                    update(table).where(table.c.id == bindparam("b_id")).values(
+                        is_active=bindparam("b_is_active"), last_seen=bindparam("b_last_seen")
+                    ),
+                    [
+                        {"b_id": user_id, "b_is_active": is_active, "b_last_seen": when}
+                        for user_id, (is_active, when) in status.items()
+                    ]
+                )
+            # After the status rows: a touch recorded after a status change is the newer one
+            if seen:
+                await db.execute(
+                    update(table).where(table.c.id == bindparam("b_id")).values(last_seen=bindparam("b_last_seen")),
+                    [{"b_id": user_id, "b_last_seen": when} for user_id, when in seen.items()]
+                )
+            await db.commit()
+
+
+last_seen_buffer = LastSeenBuffer()
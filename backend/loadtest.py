@@ -0,0 +1,349 @@
+"""Load test for /ws/chat fan-out.
+
+For each room size: seeds users, rooms and memberships through the models into
+a scratch SQLite database, starts the app under uvicorn on a local port, opens
+one socket per member, and has a few members per room send at a fixed rate.
+Reports end-to-end delivery latency percentiles, throughput and server memory.
+Needs nothing beyond requirements.txt and runs on a single Linux box.
+
+    python loadtest.py --room-sizes 2,10,100 --connections 2000 --rate 2 --duration 20
+    python loadtest.py --workers 4 --client-procs 4   # several workers over pubsub_standin
+
+Latency is measured from just before the sender's send() to the receiver
+decoding the new_message frame, so it includes the client side; use
+--client-procs to keep the client processes from becoming the bottleneck.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Room -> [(user_id, token)]
+SeededRoom = Tuple[int, List[Tuple[int, str]]]
+
+
+def seed(database_url: str, room_size: int, room_count: int) -> List[SeededRoom]:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from auth import create_access_token, get_password_hash
+    from database import Base
+    from models import User, Room, RoomMember, RoomType
+
+    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    hashed_password = get_password_hash("loadtest")  # bcrypt once, shared by every user
+
+    rooms: List[SeededRoom] = []
+    with sessionmaker(bind=engine)() as db:
+        users = [
+            User(username=f"lt{i}", email=f"lt{i}@loadtest.local", hashed_password=hashed_password, display_name=f"Load {i}")
+            for i in range(room_size * room_count)
+        ]
+        db.add_all(users)
+        db.flush()
+        for r in range(room_count):
+            members = users[r * room_size:(r + 1) * room_size]
+            room = Room(name=f"load-{r}", type=RoomType.GROUP, created_by=members[0].id)
+            db.add(room)
+            db.flush()
+            db.add_all([RoomMember(room_id=room.id, user_id=user.id) for user in members])
+            rooms.append((room.id, [(user.id, create_access_token({"sub": user.username, "uid": user.id})) for user in members]))
+        db.commit()
+    engine.dispose()
+    return rooms
+
+
+def tree_rss_mb(pid: int) -> float:
+    # RSS of a process and all of its descendants (uvicorn workers), from /proc
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, ()))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return total_kb / 1024
+
+
+def start_server(args, database_url: str, workdir: str):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "ASYNC_DATABASE_URL": database_url.replace("sqlite://", "sqlite+aiosqlite://", 1),
+        # The harness drives the send rate; keep the per-socket limits out of the way
+        "WS_RATE_LIMIT_CHAT": "100000,100000",
+        "WS_USER_RATE_LIMIT_CHAT": "100000,100000",
+        "WS_RATE_LIMIT_CONTROL": "100000,100000",
+        "WS_USER_RATE_LIMIT_CONTROL": "100000,100000",
+    })
+    from auth import SECRET_KEY
+    env["SECRET_KEY"] = SECRET_KEY
+    processes = []
+    if args.workers > 1:
+        backplane_port = args.port + 1
+        processes.append(subprocess.Popen(
+            [sys.executable, "pubsub_standin.py", "--port", str(backplane_port)],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL,
+        ))
+        env["WS_BACKPLANE_URL"] = f"redis://127.0.0.1:{backplane_port}"
+    log = open(os.path.join(workdir, "server.log"), "w")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning", "--backlog", "4096"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    processes.append(server)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/health", timeout=1)
+            return server, processes
+        except OSError:
+            time.sleep(0.2)
+    stop_server(processes)
+    raise SystemExit(f"Server did not start, see {workdir}/server.log")
+
+
+def stop_server(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run_client(url: str, token: str, room_id: int, sender: bool, args, stats: dict,
+                     connect_slots: asyncio.Semaphore, ready: asyncio.Event, go: asyncio.Event):
+    import websockets
+
+    try:
+        async with connect_slots:
+            ws = await websockets.connect(f"{url}/ws/chat?token={token}", max_size=None, ping_interval=None,
+                                          open_timeout=args.connect_timeout)
+            await ws.send(json.dumps({"type": "join_room", "room_id": room_id}))
+            while json.loads(await asyncio.wait_for(ws.recv(), args.connect_timeout))["type"] != "joined_room":
+                pass
+    except Exception:
+        stats["connect_errors"] += 1
+        ready.set()
+        return
+
+    stats["connected"] += 1
+    ready.set()
+    await go.wait()
+    end = time.time() + args.duration
+
+    async def send_loop():
+        interval = 1 / args.rate
+        next_send = time.time()
+        while next_send < end:
+            await asyncio.sleep(max(0, next_send - time.time()))
+            await ws.send(json.dumps({
+                "type": "message", "room_id": room_id, "content": "load test",
+                "correlation_id": f"lt:{time.time()}",
+            }))
+            stats["sent"] += 1
+            next_send += interval
+
+    sender_task = asyncio.create_task(send_loop()) if sender else None
+    try:
+        while True:
+            remaining = end + args.drain - time.time()
+            if remaining <= 0:
+                break
+            try:
+                frame = json.loads(await asyncio.wait_for(ws.recv(), remaining))
+            except asyncio.TimeoutError:
+                break
+            if frame["type"] == "new_message" and (frame.get("correlation_id") or "").startswith("lt:"):
+                stats["latencies"].append((time.time() - float(frame["correlation_id"][3:])) * 1000)
+            elif frame["type"] == "heartbeat":
+                await ws.send(json.dumps({"type": "heartbeat_ack"}))
+    except Exception:
+        stats["disconnects"] += 1
+    if sender_task is not None:
+        sender_task.cancel()
+    await ws.close()
+
+
+async def run_clients(url: str, rooms: List[SeededRoom], args, ready_barrier, go_barrier) -> dict:
+    stats = {"connected": 0, "connect_errors": 0, "disconnects": 0, "sent": 0, "latencies": []}
+    connect_slots = asyncio.Semaphore(args.connect_concurrency)
+    go = asyncio.Event()
+    tasks = []
+    readies = []
+    for room_id, members in rooms:
+        for index, (_, token) in enumerate(members):
+            ready = asyncio.Event()
+            readies.append(ready)
+            sender = index < args.senders_per_room
+            tasks.append(asyncio.create_task(
+                run_client(url, token, room_id, sender, args, stats, connect_slots, ready, go)
+            ))
+    for ready in readies:
+        await ready.wait()
+    # Every client process is connected before anyone sends
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, ready_barrier.wait)
+    await loop.run_in_executor(None, go_barrier.wait)
+    go.set()
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def client_process(url, rooms, args, ready_barrier, go_barrier, results):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    results.put(asyncio.run(run_clients(url, rooms, args, ready_barrier, go_barrier)))
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_scenario(args, room_size: int) -> dict:
+    room_count = max(1, args.connections // room_size)
+    with tempfile.TemporaryDirectory(prefix="webchat-loadtest-") as workdir:
+        database_url = f"sqlite:///{workdir}/loadtest.db"
+        rooms = seed(database_url, room_size, room_count)
+        server, processes = start_server(args, database_url, workdir)
+        try:
+            rss_before = tree_rss_mb(server.pid)
+            procs = max(1, min(args.client_procs, len(rooms)))
+            ready_barrier = multiprocessing.Barrier(procs + 1)
+            go_barrier = multiprocessing.Barrier(procs + 1)
+            results = multiprocessing.Queue()
+            url = f"ws://127.0.0.1:{args.port}"
+            workers = [
+                multiprocessing.Process(target=client_process,
+                                        args=(url, rooms[i::procs], args, ready_barrier, go_barrier, results))
+                for i in range(procs)
+            ]
+            connect_started = time.time()
+            for worker in workers:
+                worker.start()
+            ready_barrier.wait()
+            connect_seconds = time.time() - connect_started
+            time.sleep(args.warmup)
+            rss_connected = tree_rss_mb(server.pid)
+
+            go_barrier.wait()
+            rss_peak = rss_connected
+            collected = []
+            while len(collected) < procs:
+                try:
+                    collected.append(results.get(timeout=0.5))
+                except Exception:
+                    rss_peak = max(rss_peak, tree_rss_mb(server.pid))
+            for worker in workers:
+                worker.join()
+        finally:
+            stop_server(processes)
+
+    latencies = sorted(l for stats in collected for l in stats["latencies"])
+    sent = sum(stats["sent"] for stats in collected)
+    return {
+        "room_size": room_size,
+        "rooms": room_count,
+        "connections": sum(stats["connected"] for stats in collected),
+        "connect_errors": sum(stats["connect_errors"] for stats in collected),
+        "disconnects": sum(stats["disconnects"] for stats in collected),
+        "connect_seconds": connect_seconds,
+        "sent": sent,
+        "delivered": len(latencies),
+        "expected": sent * room_size,
+        "sent_per_second": sent / args.duration,
+        "delivered_per_second": len(latencies) / args.duration,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else float("nan"),
+        "rss_before_mb": rss_before,
+        "rss_connected_mb": rss_connected,
+        "rss_peak_mb": rss_peak,
+    }
+
+
+def print_report(results: List[dict]):
+    columns = [
+        ("room", "room_size", "d"), ("conns", "connections", "d"), ("errs", "connect_errors", "d"),
+        ("conn s", "connect_seconds", ".1f"),
+        ("sent/s", "sent_per_second", ".0f"), ("deliv/s", "delivered_per_second", ".0f"),
+        ("deliv%", None, ".1f"), ("p50ms", "p50", ".1f"), ("p90ms", "p90", ".1f"),
+        ("p99ms", "p99", ".1f"), ("maxms", "max", ".1f"), ("rss0MB", "rss_before_mb", ".0f"),
+        ("rssMB", "rss_connected_mb", ".0f"), ("peakMB", "rss_peak_mb", ".0f"),
+    ]
+    print("".join(f"{title:>9}" for title, _, _ in columns))
+    for result in results:
+        row = []
+        for _, key, fmt in columns:
+            if key is None:
+                value = 100 * result["delivered"] / result["expected"] if result["expected"] else 0.0
+            else:
+                value = result[key]
+            row.append(f"{value:>9{fmt}}")
+        print("".join(row))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--room-sizes", default="2,10,100", help="comma-separated members per room, one run each")
+    parser.add_argument("--connections", type=int, default=2000, help="sockets per run (rounded down to whole rooms)")
+    parser.add_argument("--senders-per-room", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second per sender")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of sending")
+    parser.add_argument("--warmup", type=float, default=2.0, help="idle seconds after connecting")
+    parser.add_argument("--drain", type=float, default=3.0, help="seconds to keep reading after the last send")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (>1 starts pubsub_standin)")
+    parser.add_argument("--client-procs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    # uvicorn drops a WebSocket handshake the app has not accepted within ~10s,
+    # so flooding it with connects shows up as errors rather than slow connects
+    parser.add_argument("--connect-concurrency", type=int, default=25, help="handshakes in flight per client process")
+    parser.add_argument("--connect-timeout", type=float, default=60.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", action="store_true", help="print results as JSON instead of a table")
+    args = parser.parse_args()
+
+    results = []
+    for room_size in (int(size) for size in args.room_sizes.split(",")):
+        print(f"room size {room_size}: {args.connections // room_size} rooms ...", file=sys.stderr)
+        results.append(run_scenario(args, room_size))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
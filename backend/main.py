@@ -4,7 +4,12 @@ from dotenv import load_dotenv
 import os
 
 from contextlib import asynccontextmanager
-from database import engine, Base
+from database import engine, async_engine, async_read_engine, Base
+from last_seen import last_seen_buffer
+from message_writer import message_writer
+from password_pool import password_pool
+from migrate import run_migrations
+from metrics import MetricsMiddleware, instrument_engine, render as render_metrics
 from routers import auth_router, api_router, websocket_router, room_router, message_router, file_router, sync_router, friend_router
 
 @asynccontextmanager
@@ -33,12 +38,31 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             print(f"Error dropping database: {e}")
 
-    # Create database tables if they don't exist
+    # Create database tables if they don't exist, then bring existing ones up to date
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    # Join the cross-worker WebSocket backplane and start the background writers
+    await last_seen_buffer.start()
+    await websocket_router.manager.start()
+    await websocket_router.presence.start()
+    await websocket_router.read_watermarks.start()
+    message_writer.start()
+    password_pool.start()
     yield
+    await message_writer.stop()
+    await websocket_router.read_watermarks.stop()
+    await websocket_router.presence.stop()
+    # After presence, whose final flush feeds the buffer
+    await last_seen_buffer.stop()
+    password_pool.stop()
+    await websocket_router.manager.stop()
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
 
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 import os
 
 # Ensure uploads directory exists
@@ -99,6 +123,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency / status / DB query count per route, served at /metrics
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+if async_read_engine is not async_engine:
+    instrument_engine(async_read_engine.sync_engine)
+
 # Include routers
 app.include_router(auth_router.router)
 app.include_router(api_router.router)
@@ -116,3 +147,20 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Prometheus text format; values are for this worker process
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+if __name__ == "__main__":
+    import uvicorn
+    # permessage-deflate is negotiated per socket, only with clients that offer it.
+    # WS_PER_MESSAGE_DEFLATE applies here only; with the uvicorn CLI
+    # (uvicorn main:app) pass --ws-per-message-deflate false instead
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "True") == "True",
+    )
@@ -0,0 +1,80 @@
+import os
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "60"))
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "100000"))
+
+
+class MembershipCache:
+    """(room_id, user_id) -> is_member, with a TTL as a safety net.
+
+    Positive and negative answers are cached; the room routers invalidate
+    entries explicitly whenever membership changes.
+    """
+
+    def __init__(self, ttl: float = MEMBERSHIP_CACHE_TTL, max_entries: int = MEMBERSHIP_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: Dict[Tuple[int, int], Tuple[bool, float]] = {}
+        # room_id -> user_ids with an entry, so a whole room can be dropped cheaply
+        self.room_index: Dict[int, Set[int]] = {}
+        # Bumped on every invalidation so a DB lookup that raced with one is not cached
+        self.generation = 0
+
+    def get(self, room_id: int, user_id: int) -> Optional[bool]:
+        entry = self.entries.get((room_id, user_id))
+        if entry is None:
+            return None
+        is_member, expires_at = entry
+        if expires_at < time.monotonic():
+            self._discard(room_id, user_id)
+            return None
+        return is_member
+
+    def set(self, room_id: int, user_id: int, is_member: bool, generation: Optional[int] = None):
+        if generation is not None and generation != self.generation:
+            return
+        if len(self.entries) >= self.max_entries and (room_id, user_id) not in self.entries:
+            self._evict()
+        self.entries[(room_id, user_id)] = (is_member, time.monotonic() + self.ttl)
+        self.room_index.setdefault(room_id, set()).add(user_id)
+
+    def invalidate(self, room_id: int, user_ids: Optional[Iterable[int]] = None):
+        # Without user_ids the whole room is dropped
+        self.generation += 1
+        if user_ids is None:
+            for user_id in self.room_index.pop(room_id, ()):
+                self.entries.pop((room_id, user_id), None)
+            return
+        for user_id in user_ids:
+            self._discard(room_id, user_id)
+
+    def clear(self):
+        self.entries.clear()
+        self.room_index.clear()
+
+    def _discard(self, room_id: int, user_id: int):
+        self.entries.pop((room_id, user_id), None)
+        users = self.room_index.get(room_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self.room_index[room_id]
+
+    def _evict(self):
+        # Drop expired entries; if still full, drop the oldest tenth (dicts keep insertion order)
+        now = time.monotonic()
+        for key, (_, expires_at) in list(self.entries.items()):
+            if expires_at < now:
+                self._discard(*key)
+        if len(self.entries) >= self.max_entries:
+            for key in list(self.entries)[: max(1, self.max_entries // 10)]:
+                self._discard(*key)
+
+
+membership_cache = MembershipCache()
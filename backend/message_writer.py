@@ -0,0 +1,147 @@
+import asyncio
+import os
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from database import AsyncSessionLocal
+from models import Message
+from unread_counts import increment_unread_counts
+
+load_dotenv()
+
+# Flush when this many messages are queued...
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "256"))
+# ...or after this long collecting a batch (ms). Messages queued while a
+# commit is in flight join the next batch anyway, so this can stay small.
+MESSAGE_BATCH_WINDOW_MS = float(os.getenv("MESSAGE_BATCH_WINDOW_MS", "2"))
+
+PendingMessage = Tuple[dict, asyncio.Future]
+
+
+class MessageWriter:
+    """Single-writer ingest pipeline for chat messages (group commit).
+
+    Handlers submit() a message and await its future; one writer task inserts
+    whatever has queued up in a single transaction and resolves every future
+    with the saved Message (id and created_at populated). If the writer task
+    dies it is replaced on the next submit(), and the queue it left is kept.
+    """
+
+    def __init__(self, batch_size: int = MESSAGE_BATCH_SIZE, window_ms: float = MESSAGE_BATCH_WINDOW_MS):
+        self.batch_size = batch_size
+        self.window = window_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stopped = False
+
+    def start(self):
+        self.stopped = False
+        self._ensure_running()
+
+    def _ensure_running(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        if self.task is not None and not self.task.done():
+            return
+        if self.task is not None:
+            reason = "cancelled" if self.task.cancelled() else repr(self.task.exception())
+            print(f"Message writer task ended ({reason}), restarting")
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Flush everything already submitted, then stop the writer until start()
+        if self.stopped:
+            return
+        self.stopped = True
+        if self.task is None:
+            return
+        # A dead writer is replaced so the messages it left queued are still saved
+        self._ensure_running()
+        await self.queue.put(None)
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def submit(self, content: str, sender_id: int, room_id: int, message_type: str) -> Message:
+        if self.stopped:
+            raise RuntimeError("Message writer is stopped")
+        self._ensure_running()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(({
+            "content": content,
+            "sender_id": sender_id,
+            "room_id": room_id,
+            "message_type": message_type,
+        }, future))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        batch: List[PendingMessage] = []
+        try:
+            while not stopping:
+                item = await self.queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                if self.window > 0:
+                    await asyncio.sleep(self.window)
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                await self._flush(batch)
+                batch = []
+        except BaseException as e:
+            # The batch in hand fails instead of leaving its senders waiting forever
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Message writer stopped while saving: {e!r}"))
+            raise
+
+    async def _flush(self, batch: List[PendingMessage]):
+        try:
+            results = await _insert_batch([fields for fields, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+async def _insert_batch(rows: List[dict]) -> list:
+    # Objects stay usable after commit (expire_on_commit=False), so no refresh round trip
+    async with AsyncSessionLocal() as db:
+        messages = [Message(**fields) for fields in rows]
+        db.add_all(messages)
+        try:
+            await db.flush()
+            # Recipients' unread counters move in the same transaction, one UPDATE per batch
+            await increment_unread_counts(db, messages)
+            await db.commit()
+            return messages
+        except Exception:
+            await db.rollback()
+        # One bad row (e.g. room deleted meanwhile) must not fail the whole batch
+        results = []
+        for fields in rows:
+            message = Message(**fields)
+            db.add(message)
+            try:
+                await db.flush()
+                await increment_unread_counts(db, [message])
+                await db.commit()
+                results.append(message)
+            except Exception as e:
+                await db.rollback()
+                results.append(e)
+        return results
+
+
+message_writer = MessageWriter()
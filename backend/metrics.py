@@ -0,0 +1,179 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+# Minimal Prometheus text-format (0.0.4) metrics, cheap enough to leave on.
+# Values are per worker process; scrape every worker (or sum in Prometheus).
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, labels: Labels = ()):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self.values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Collected:
+    """Metric whose samples are read from live state at scrape time (gauges, foreign counters)."""
+
+    def __init__(self, name: str, help: str, kind: str, collect: Callable, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.collect()
+        samples = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, sample in samples:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {sample}")
+        return lines
+
+
+REGISTRY: List[object] = []
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    metric = Counter(name, help, labelnames)
+    REGISTRY.append(metric)
+    return metric
+
+
+def histogram(name: str, help: str, buckets: Sequence[float], labelnames: Sequence[str] = ()) -> Histogram:
+    metric = Histogram(name, help, buckets, labelnames)
+    REGISTRY.append(metric)
+    return metric
+
+
+def collected(name: str, help: str, collect: Callable, kind: str = "gauge", labelnames: Sequence[str] = ()):
+    REGISTRY.append(Collected(name, help, kind, collect, labelnames))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            print(f"Metric {metric.name} failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+# --- HTTP and database instrumentation ---
+
+HTTP_REQUESTS = counter("webchat_http_requests_total", "HTTP requests", ("method", "route", "status"))
+HTTP_LATENCY = histogram(
+    "webchat_http_request_duration_seconds", "HTTP request latency",
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5), ("method", "route"),
+)
+HTTP_DB_QUERIES = histogram(
+    "webchat_http_request_db_queries", "Database queries issued per HTTP request",
+    (0, 1, 2, 3, 5, 10, 20, 50, 100), ("method", "route"),
+)
+DB_QUERIES = counter("webchat_db_queries_total", "Database queries (all sources)")
+
+# Query counter of the HTTP request being served, if any
+_request_queries: ContextVar[Optional[list]] = ContextVar("request_queries", default=None)
+
+
+def _count_query(*_):
+    DB_QUERIES.inc()
+    holder = _request_queries.get()
+    if holder is not None:
+        holder[0] += 1
+
+
+def instrument_engine(engine):
+    # Pass a sync Engine (for an AsyncEngine, its .sync_engine)
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: latency, status and DB query count per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        queries = [0]
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_queries.reset(token)
+            # Route template (e.g. /rooms/{room_id}), never the raw path, to bound label cardinality
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", "unmatched"))
+            HTTP_LATENCY.observe(elapsed, labels)
+            HTTP_DB_QUERIES.observe(queries[0], labels)
+            HTTP_REQUESTS.inc(1, labels + (str(status[0]),))
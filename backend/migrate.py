@@ -0,0 +1,93 @@
+"""Minimal schema migrations.
+
+Each file in migrations/ named NNNN_description.py defines upgrade(conn),
+which gets a SQLAlchemy Connection inside a transaction. Applied versions are
+recorded in schema_migrations; run_migrations() applies the rest in order.
+main.py runs it at startup after create_all, and it can be run by hand:
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list migrations and whether they are applied
+
+create_all only creates missing tables, so anything that changes an existing
+table (indexes, columns, backfills) needs a migration. New tables and the
+final shape of the schema still live in models.py; migrations must therefore
+be idempotent against a database that create_all just built (IF NOT EXISTS).
+"""
+import argparse
+import importlib.util
+import os
+from datetime import datetime
+from typing import List, Tuple
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, select
+from sqlalchemy.exc import IntegrityError
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", String, primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def discover() -> List[Tuple[str, object]]:
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not filename.endswith(".py") or not filename[:4].isdigit():
+            continue
+        version = filename[:-3]
+        spec = importlib.util.spec_from_file_location(f"migrations.{version}", os.path.join(MIGRATIONS_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append((version, module))
+    return migrations
+
+
+def applied_versions(engine) -> set:
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def run_migrations(engine) -> List[str]:
+    # Returns the versions applied by this call
+    done = applied_versions(engine)
+    applied = []
+    for version, module in discover():
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                # Recording first takes the write lock (SQLite) or blocks on the
+                # row (Postgres), so workers starting together apply each migration once
+                conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.utcnow()))
+                module.upgrade(conn)
+        except IntegrityError:
+            # Another worker applied it first
+            continue
+        print(f"Applied migration {version}")
+        applied.append(version)
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations")
+    parser.add_argument("--status", action="store_true", help="List migrations instead of applying them")
+    args = parser.parse_args()
+
+    from database import Base, engine
+    import models  # noqa: F401  (registers the tables)
+
+    if args.status:
+        done = applied_versions(engine)
+        for version, _ in discover():
+            print(f"{'applied' if version in done else 'pending'}  {version}")
+        return
+    Base.metadata.create_all(bind=engine)
+    if not run_migrations(engine):
+        print("Database is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Composite indexes for the hot queries (history, resume, membership, friends, receipts)."""
+from sqlalchemy import text
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_messages_room_created_id ON messages (room_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_messages_room_id_id ON messages (room_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_messages_sender_room ON messages (sender_id, room_id)",
+    "CREATE INDEX IF NOT EXISTS ix_room_members_user_room ON room_members (user_id, room_id)",
+    "CREATE INDEX IF NOT EXISTS ix_file_attachments_message_id ON file_attachments (message_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_read_receipts_message_user ON read_receipts (message_id, user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_friend_requests_pair_status ON friend_requests (sender_id, receiver_id, status)",
+    "CREATE INDEX IF NOT EXISTS ix_friend_requests_receiver_status ON friend_requests (receiver_id, status)",
+]
+
+# Superseded by the composites above; nothing filters on created_at without room_id
+DROPPED = ["ix_messages_room_id", "ix_messages_created_at"]
+
+
+def upgrade(conn):
+    # The unique index fails on duplicates left by the old one-row-per-read receipts
+    conn.execute(text(
+        "DELETE FROM read_receipts WHERE id NOT IN "
+        "(SELECT MIN(id) FROM read_receipts GROUP BY message_id, user_id)"
+    ))
+    for statement in INDEXES:
+        conn.execute(text(statement))
+    for name in DROPPED:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
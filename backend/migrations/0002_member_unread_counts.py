@@ -0,0 +1,22 @@
+"""Materialized unread counter on room_members, filled from existing messages."""
+from sqlalchemy import inspect, text
+
+# Frozen copy of the counter's definition as of this migration; unread_counts.py
+# keeps its own for the repair job and may change without changing this backfill
+BACKFILL = """
+UPDATE room_members SET unread_count = (
+    SELECT count(*) FROM messages
+    WHERE messages.room_id = room_members.room_id
+      AND messages.sender_id != room_members.user_id
+      AND messages.is_deleted = false
+      AND (room_members.last_read_at IS NULL OR messages.created_at > room_members.last_read_at)
+)
+"""
+
+
+def upgrade(conn):
+    # create_all already adds the column to a new database
+    columns = {column["name"] for column in inspect(conn).get_columns("room_members")}
+    if "unread_count" not in columns:
+        conn.execute(text("ALTER TABLE room_members ADD COLUMN unread_count INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text(BACKFILL))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Enum, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -52,19 +52,26 @@ class RoomMember(Base):
     role = Column(String, default="member") # admin, member
     joined_at = Column(DateTime, default=datetime.utcnow)
     last_read_at = Column(DateTime, default=datetime.utcnow)
+    # Messages from others after last_read_at, kept by unread_counts.py
+    unread_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     room = relationship("Room", back_populates="members")
     user = relationship("User", back_populates="room_memberships")
 
+    # The primary key covers lookups by room; this one covers "rooms of a user"
+    __table_args__ = (
+        Index("ix_room_members_user_room", "user_id", "room_id"),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
     
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text, nullable=True) # Can be null if just a file? Keep simple for now.
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False, index=True)
+    room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
     message_type = Column(String, default="text") # text, system, file
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = Column(Boolean, default=False)
     is_edited = Column(Boolean, default=False)
@@ -74,6 +81,16 @@ class Message(Base):
     read_receipts = relationship("ReadReceipt", back_populates="message", cascade="all, delete-orphan")
     attachments = relationship("FileAttachment", back_populates="message", cascade="all, delete-orphan")
 
+    # Existing databases get these from migrations/0001_hot_path_indexes.py
+    __table_args__ = (
+        # Room history, newest first
+        Index("ix_messages_room_created_id", "room_id", "created_at", "id"),
+        # Resume/catch-up by id within a room
+        Index("ix_messages_room_id_id", "room_id", "id"),
+        # Sync: rooms a user has posted in
+        Index("ix_messages_sender_room", "sender_id", "room_id"),
+    )
+
 class FileAttachment(Base):
     __tablename__ = "file_attachments"
     
@@ -87,6 +104,10 @@ class FileAttachment(Base):
     
     message = relationship("Message", back_populates="attachments")
 
+    __table_args__ = (
+        Index("ix_file_attachments_message_id", "message_id"),
+    )
+
 class ReadReceipt(Base):
     __tablename__ = "read_receipts"
     
@@ -98,6 +119,10 @@ class ReadReceipt(Base):
     message = relationship("Message", back_populates="read_receipts")
     user = relationship("User", back_populates="read_receipts")
 
+    __table_args__ = (
+        Index("uq_read_receipts_message_user", "message_id", "user_id", unique=True),
+    )
+
 class FriendRequestStatus(str, enum.Enum):
     PENDING = "pending"
     ACCEPTED = "accepted"
@@ -115,3 +140,9 @@ class FriendRequest(Base):
     
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_friend_requests")
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_friend_requests")
+
+    # One index per direction, so "either side is this user" is two index searches
+    __table_args__ = (
+        Index("ix_friend_requests_pair_status", "sender_id", "receiver_id", "status"),
+        Index("ix_friend_requests_receiver_status", "receiver_id", "status"),
+    )
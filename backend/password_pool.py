@@ -0,0 +1,63 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# bcrypt releases the GIL while hashing, so threads run hashes in parallel
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashes running or waiting; requests beyond this are turned away instead of queued
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "2"))
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+class PasswordPool:
+    """Runs password hashing/verification off the event loop on a bounded pool.
+
+    A login burst queues on the pool (up to max_pending) rather than blocking
+    the loop that delivers chat frames; past that, callers get PasswordPoolBusy.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def run(self, fn: Callable, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordPoolBusy()
+        self.start()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+
+password_pool = PasswordPool()
+
+metrics.collected("webchat_password_jobs_pending", "Password hashes running or queued",
+                  lambda: password_pool.pending)
+metrics.collected("webchat_password_jobs_rejected_total", "Password hashes turned away at the admission limit",
+                  lambda: password_pool.rejected, kind="counter")
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select, or_
+
+from connections import encode_frame
+from database import AsyncSessionLocal
+from last_seen import last_seen_buffer
+from models import FriendRequest, FriendRequestStatus
+
+load_dotenv()
+
+# Transitions inside this window are coalesced; a reconnect within it sends nothing
+PRESENCE_DEBOUNCE_SECONDS = float(os.getenv("PRESENCE_DEBOUNCE_SECONDS", "2"))
+FRIEND_CACHE_TTL = float(os.getenv("FRIEND_CACHE_TTL", "300"))
+
+
+class PresenceEngine:
+    """Online/offline tracking for connected users.
+
+    Counts sessions per user (tabs/devices, on this and other workers), debounces
+    transitions, and only announces real state changes to friends, batched into
+    one frame per recipient. Friend-id sets are cached and invalidated when a
+    friend request is answered.
+    """
+
+    def __init__(self, manager, debounce: float = PRESENCE_DEBOUNCE_SECONDS, friend_ttl: float = FRIEND_CACHE_TTL):
+        self.manager = manager
+        self.debounce = debounce
+        self.friend_ttl = friend_ttl
+        # user_id -> open sessions on this worker
+        self.local_sessions: Dict[int, int] = {}
+        # user_id -> other workers holding at least one session
+        self.remote_workers: Dict[int, Set[str]] = {}
+        # Users announced online to their friends, by this or another worker
+        self.announced: Set[int] = set()
+        self.friend_cache: Dict[int, Tuple[Set[int], float]] = {}
+        self.dirty: Set[int] = set()
+        self.dirty_event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+        manager.register_envelope_handler("presence", self._on_remote_presence)
+        manager.register_envelope_handler("invalidate_friends", self._on_remote_invalidate)
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        # Final flush so users do not stay marked online across a restart
+        self.dirty.update(self.local_sessions)
+        self.local_sessions.clear()
+        await self._flush()
+
+    def is_online(self, user_id: int) -> bool:
+        return user_id in self.local_sessions or bool(self.remote_workers.get(user_id))
+
+    async def session_opened(self, user_id: int):
+        count = self.local_sessions.get(user_id, 0) + 1
+        self.local_sessions[user_id] = count
+        if count == 1:
+            await self.manager.publish_event("presence", user_id=user_id, online=True)
+            self._mark_dirty(user_id)
+
+    async def session_closed(self, user_id: int):
+        count = self.local_sessions.get(user_id, 0) - 1
+        if count > 0:
+            self.local_sessions[user_id] = count
+            return
+        self.local_sessions.pop(user_id, None)
+        await self.manager.publish_event("presence", user_id=user_id, online=False)
+        self._mark_dirty(user_id)
+
+    async def invalidate_friends(self, *user_ids: int):
+        for user_id in user_ids:
+            self.friend_cache.pop(user_id, None)
+        await self.manager.publish_event("invalidate_friends", user_ids=list(user_ids))
+
+    def _on_remote_presence(self, envelope: dict):
+        # Another worker's session count for this user crossed zero; that worker
+        # announces the change, we only keep our view of the global state in step
+        user_id = envelope["user_id"]
+        workers = self.remote_workers.setdefault(user_id, set())
+        if envelope["online"]:
+            workers.add(envelope["origin"])
+            self.announced.add(user_id)
+        else:
+            workers.discard(envelope["origin"])
+            if not workers:
+                del self.remote_workers[user_id]
+                if user_id not in self.local_sessions:
+                    self.announced.discard(user_id)
+
+    def _on_remote_invalidate(self, envelope: dict):
+        for user_id in envelope["user_ids"]:
+            self.friend_cache.pop(user_id, None)
+
+    def _mark_dirty(self, user_id: int):
+        self.dirty.add(user_id)
+        self.dirty_event.set()
+
+    async def _run(self):
+        while True:
+            await self.dirty_event.wait()
+            await asyncio.sleep(self.debounce)
+            self.dirty_event.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                print(f"Presence flush failed: {e}")
+
+    async def _flush(self):
+        dirty, self.dirty = self.dirty, set()
+        online: List[int] = []
+        offline: List[int] = []
+        for user_id in dirty:
+            if self.is_online(user_id):
+                if user_id not in self.announced:
+                    self.announced.add(user_id)
+                    online.append(user_id)
+            elif user_id in self.announced:
+                # Announced by the worker that saw the last session close
+                self.announced.discard(user_id)
+                offline.append(user_id)
+        if not online and not offline:
+            return
+
+        now = datetime.utcnow()
+        # Written by last_seen_buffer together with REST last_seen updates
+        for user_id in online:
+            last_seen_buffer.set_status(user_id, True, now)
+        for user_id in offline:
+            last_seen_buffer.set_status(user_id, False, now)
+
+        friends = await self.friend_ids(online + offline)
+        last_seen = now.isoformat()
+        updates_by_recipient: Dict[int, List[dict]] = {}
+        for user_id, status in [(u, "online") for u in online] + [(u, "offline") for u in offline]:
+            status_update = {"user_id": user_id, "status": status, "last_seen": last_seen}
+            for friend_id in friends.get(user_id, ()):
+                updates_by_recipient.setdefault(friend_id, []).append(status_update)
+        for user_id in offline:
+            self.friend_cache.pop(user_id, None)
+
+        # Recipients with the same set of updates share one encoded frame
+        groups: Dict[Tuple[int, ...], Tuple[List[dict], List[int]]] = {}
+        for recipient, updates in updates_by_recipient.items():
+            key = tuple(u["user_id"] for u in updates)
+            groups.setdefault(key, (updates, []))[1].append(recipient)
+        for updates, recipients in groups.values():
+            if len(updates) == 1:
+                message = {"type": "user_status", **updates[0]}
+            else:
+                message = {"type": "user_status_batch", "statuses": updates}
+            await self.manager.send_frame_to_users(recipients, encode_frame(message))
+
+    async def friend_ids(self, user_ids: Iterable[int]) -> Dict[int, Set[int]]:
+        now = time.monotonic()
+        result: Dict[int, Set[int]] = {}
+        missing: List[int] = []
+        for user_id in user_ids:
+            cached = self.friend_cache.get(user_id)
+            if cached is not None and cached[1] > now:
+                result[user_id] = cached[0]
+            else:
+                missing.append(user_id)
+        if missing:
+            loaded = await _load_friend_ids(missing)
+            expires_at = now + self.friend_ttl
+            for user_id in missing:
+                friends = loaded.get(user_id, set())
+                self.friend_cache[user_id] = (friends, expires_at)
+                result[user_id] = friends
+        return result
+
+
+async def _load_friend_ids(user_ids: List[int]) -> Dict[int, Set[int]]:
+    # One query for every user whose friend set is not cached
+    wanted = set(user_ids)
+    friends: Dict[int, Set[int]] = {}
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(FriendRequest.sender_id, FriendRequest.receiver_id).where(
+                FriendRequest.status == FriendRequestStatus.ACCEPTED,
+                or_(FriendRequest.sender_id.in_(wanted), FriendRequest.receiver_id.in_(wanted))
+            )
+        )
+        for sender_id, receiver_id in result:
+            if sender_id in wanted:
+                friends.setdefault(sender_id, set()).add(receiver_id)
+            if receiver_id in wanted:
+                friends.setdefault(receiver_id, set()).add(sender_id)
+    return friends
+
@@ -0,0 +1,83 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+
+class Principal:
+    """The authenticated caller: a detached copy of the User columns endpoints read.
+
+    Not attached to any session; load the User row to change it.
+    """
+
+    __slots__ = (
+        "id", "username", "email", "display_name", "avatar_url", "bio",
+        "theme_preference", "is_active", "created_at", "last_seen",
+    )
+
+    def __init__(self, user):
+        for name in self.__slots__:
+            setattr(self, name, getattr(user, name))
+
+
+class PrincipalCache:
+    """Token subject (username) -> Principal, LRU-bounded with a TTL as a safety net.
+
+    Entries are invalidated explicitly whenever a user's row changes.
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_entries: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        # user_id -> username, so invalidation works from either
+        self.usernames: Dict[int, str] = {}
+        # Bumped on every invalidation so a DB lookup that raced with one is not cached
+        self.generation = 0
+
+    def get(self, username: str) -> Optional[Principal]:
+        entry = self.entries.get(username)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if expires_at < time.monotonic():
+            self._discard(username)
+            return None
+        self.entries.move_to_end(username)
+        return principal
+
+    def set(self, user, generation: Optional[int] = None) -> Principal:
+        principal = Principal(user)
+        if generation is not None and generation != self.generation:
+            return principal
+        self.entries[principal.username] = (principal, time.monotonic() + self.ttl)
+        self.entries.move_to_end(principal.username)
+        self.usernames[principal.id] = principal.username
+        while len(self.entries) > self.max_entries:
+            self._discard(next(iter(self.entries)))
+        return principal
+
+    def invalidate(self, user_id: int):
+        self.generation += 1
+        username = self.usernames.get(user_id)
+        if username is not None:
+            self._discard(username)
+
+    def clear(self):
+        self.entries.clear()
+        self.usernames.clear()
+
+    def _discard(self, username: str):
+        entry = self.entries.pop(username, None)
+        if entry is not None:
+            self.usernames.pop(entry[0].id, None)
+
+
+principal_cache = PrincipalCache()
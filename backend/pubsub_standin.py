@@ -0,0 +1,89 @@
+"""Minimal Redis-protocol pub/sub server for local multi-worker runs.
+
+Implements just what RedisBackplane uses (PING, AUTH, SUBSCRIBE, UNSUBSCRIBE,
+PUBLISH), so several uvicorn workers can share a backplane on one box without
+installing Redis:
+
+    python pubsub_standin.py --port 6379
+    WS_BACKPLANE_URL=redis://localhost:6379 uvicorn main:app --workers 4
+"""
+import argparse
+import asyncio
+from typing import Dict, Set
+
+from backplane import _read_reply
+
+
+class PubSubStandin:
+    def __init__(self):
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed: Set[bytes] = set()
+        try:
+            while True:
+                try:
+                    command = await _read_reply(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                if not isinstance(command, list) or not command:
+                    writer.write(b"-ERR protocol error\r\n")
+                    continue
+                name = command[0].upper()
+                args = command[1:]
+
+                if name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif name == b"AUTH":
+                    writer.write(b"+OK\r\n")
+                elif name == b"SUBSCRIBE":
+                    for channel in args:
+                        self.channels.setdefault(channel, set()).add(writer)
+                        subscribed.add(channel)
+                        writer.write(b"*3\r\n$9\r\nsubscribe\r\n" + _bulk(channel) + b":%d\r\n" % len(subscribed))
+                elif name == b"UNSUBSCRIBE":
+                    for channel in args or list(subscribed):
+                        self._unsubscribe(channel, writer)
+                        subscribed.discard(channel)
+                        writer.write(b"*3\r\n$11\r\nunsubscribe\r\n" + _bulk(channel) + b":%d\r\n" % len(subscribed))
+                elif name == b"PUBLISH" and len(args) == 2:
+                    channel, payload = args
+                    receivers = self.channels.get(channel, set())
+                    message = b"*3\r\n$7\r\nmessage\r\n" + _bulk(channel) + _bulk(payload)
+                    for receiver in receivers:
+                        receiver.write(message)
+                    writer.write(b":%d\r\n" % len(receivers))
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        finally:
+            for channel in subscribed:
+                self._unsubscribe(channel, writer)
+            writer.close()
+
+    def _unsubscribe(self, channel: bytes, writer: asyncio.StreamWriter):
+        receivers = self.channels.get(channel)
+        if receivers is not None:
+            receivers.discard(writer)
+            if not receivers:
+                del self.channels[channel]
+
+
+def _bulk(data: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+async def serve(host: str, port: int):
+    standin = PubSubStandin()
+    server = await asyncio.start_server(standin.handle, host, port)
+    print(f"Pub/sub stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Inbound /ws/chat frame types, grouped by what they cost the server
+FRAME_CATEGORIES = {
+    "message": "chat",
+    "call_offer": "signaling",
+    "call_answer": "signaling",
+    "call_reject": "signaling",
+    "call_end": "signaling",
+    "ice_candidate": "signaling",
+    "ping": "ping",
+    "heartbeat_ack": "ping",
+}
+DEFAULT_CATEGORY = "control"  # join_room, leave_room, read_receipt, unknown types
+
+# category -> (rate per second, burst, action when over the limit)
+#   "reject" - drop the frame (chat frames get a rate_limited reply)
+#   "defer"  - stop reading the socket until a token is free (TCP backpressure),
+#              rejecting only if that would take longer than WS_RATE_MAX_DEFER_SECONDS
+DEFAULT_LIMITS = {
+    "chat": (5, 20, "reject"),
+    "signaling": (50, 200, "defer"),
+    "ping": (1, 5, "reject"),
+    "control": (20, 50, "defer"),
+}
+LIMIT_ACTIONS = ("reject", "defer")
+MAX_DEFER_SECONDS = float(os.getenv("WS_RATE_MAX_DEFER_SECONDS", "2"))
+
+
+def _parse_limit(value: str, default_action: str) -> Tuple[float, float, str]:
+    # "rate,burst[,action]" with rate > 0, burst >= 1 and action in LIMIT_ACTIONS
+    parts = [part.strip() for part in value.split(",")]
+    if len(parts) not in (2, 3):
+        raise ValueError("expected rate,burst[,action]")
+    rate, burst = float(parts[0]), float(parts[1])
+    if rate <= 0 or burst < 1:
+        raise ValueError("rate must be > 0 and burst >= 1")
+    action = parts[2] if len(parts) == 3 else default_action
+    if action not in LIMIT_ACTIONS:
+        raise ValueError(f"action must be one of {', '.join(LIMIT_ACTIONS)}")
+    return rate, burst, action
+
+
+def _load_limits(prefix: str, scale: float) -> Dict[str, Tuple[float, float, str]]:
+    # WS_RATE_LIMIT_CHAT=5,20,reject  (per connection)
+    # WS_USER_RATE_LIMIT_CHAT=10,40   (per user, across all of their sockets on this worker)
+    # A malformed value is reported and the default is used, so a typo cannot stop startup
+    limits = {}
+    for category, (rate, burst, action) in DEFAULT_LIMITS.items():
+        name = f"{prefix}_{category.upper()}"
+        value = os.getenv(name)
+        rate, burst = rate * scale, burst * scale
+        if value:
+            try:
+                rate, burst, action = _parse_limit(value, action)
+            except ValueError as e:
+                print(f"Ignoring {name}={value!r} ({e}); using {rate:g},{burst:g},{action}")
+        limits[category] = (float(rate), float(burst), action)
+    return limits
+
+
+CONNECTION_LIMITS = _load_limits("WS_RATE_LIMIT", 1)
+USER_LIMITS = _load_limits("WS_USER_RATE_LIMIT", 2)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        # Seconds until one token is available (0 if one is available now)
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class FrameLimiter:
+    """Token buckets for one socket, checked together with its user's shared buckets."""
+
+    def __init__(self, rate_limiter: "RateLimiter", user_id: int):
+        self.rate_limiter = rate_limiter
+        self.user_id = user_id
+        self.buckets = {category: TokenBucket(rate, burst) for category, (rate, burst, _) in CONNECTION_LIMITS.items()}
+        self.throttled_frames = 0
+
+    async def admit(self, message_type: str) -> Optional[float]:
+        # None if the frame may be processed, otherwise seconds the client should wait
+        category = FRAME_CATEGORIES.get(message_type, DEFAULT_CATEGORY)
+        buckets = (self.buckets[category], self.rate_limiter.user_bucket(self.user_id, category))
+        wait = max(bucket.wait_time(time.monotonic()) for bucket in buckets)
+        if wait > 0:
+            action = CONNECTION_LIMITS[category][2]
+            self.throttled_frames += 1
+            if action != "defer" or wait > MAX_DEFER_SECONDS:
+                self.rate_limiter.count(category, "rejected")
+                return wait
+            self.rate_limiter.count(category, "deferred")
+            # Not reading the socket meanwhile pushes back on the client through TCP
+            await asyncio.sleep(wait)
+            for bucket in buckets:
+                bucket.wait_time(time.monotonic())
+        for bucket in buckets:
+            bucket.consume()
+        return None
+
+
+class RateLimiter:
+    """Per-user token buckets shared by a user's sockets, plus throttle counters."""
+
+    def __init__(self):
+        self.user_buckets: Dict[int, Dict[str, TokenBucket]] = {}
+        self.user_refs: Dict[int, int] = {}
+        # "category:rejected" / "category:deferred" -> frames
+        self.throttled: Dict[str, int] = {}
+
+    def acquire(self, user_id: int) -> FrameLimiter:
+        self.user_refs[user_id] = self.user_refs.get(user_id, 0) + 1
+        return FrameLimiter(self, user_id)
+
+    def release(self, limiter: FrameLimiter):
+        # User buckets go away with the user's last socket
+        count = self.user_refs.get(limiter.user_id, 0) - 1
+        if count > 0:
+            self.user_refs[limiter.user_id] = count
+            return
+        self.user_refs.pop(limiter.user_id, None)
+        self.user_buckets.pop(limiter.user_id, None)
+
+    def user_bucket(self, user_id: int, category: str) -> TokenBucket:
+        buckets = self.user_buckets.setdefault(user_id, {})
+        bucket = buckets.get(category)
+        if bucket is None:
+            rate, burst, _ = USER_LIMITS[category]
+            bucket = buckets[category] = TokenBucket(rate, burst)
+        return bucket
+
+    def count(self, category: str, outcome: str):
+        key = f"{category}:{outcome}"
+        self.throttled[key] = self.throttled.get(key, 0) + 1
+
+
+rate_limiter = RateLimiter()
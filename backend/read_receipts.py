@@ -0,0 +1,125 @@
+import asyncio
+import os
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update, bindparam, or_
+
+from database import AsyncSessionLocal
+from models import Message, RoomMember
+from unread_counts import recount_expression
+
+load_dotenv()
+
+READ_RECEIPT_FLUSH_SECONDS = float(os.getenv("READ_RECEIPT_FLUSH_SECONDS", "1"))
+
+
+class ReadWatermarks:
+    """Per-member read state: "user X has read room R up to message Y".
+
+    Reads are stored as RoomMember.last_read_at (the created_at of the newest
+    message read) instead of one ReadReceipt row per message. Advances are
+    buffered, written in one batched UPDATE per flush, and broadcast to the
+    room once per member.
+    """
+
+    def __init__(self, manager, interval: float = READ_RECEIPT_FLUSH_SECONDS):
+        self.manager = manager
+        self.interval = interval
+        # (room_id, user_id) -> highest message id reported since the last flush
+        self.pending: Dict[Tuple[int, int], int] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+    def advance(self, room_id: int, user_id: int, message_id: int):
+        key = (room_id, user_id)
+        if message_id > self.pending.get(key, 0):
+            self.pending[key] = message_id
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Read receipt flush failed: {e}")
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Message.id, Message.room_id, Message.created_at).where(
+                    Message.id.in_(set(pending.values()))
+                )
+            )
+            messages = {row.id: row for row in result}
+
+            # Two column INs search the primary key; a row-value IN makes SQLite scan the table.
+            # Extra (room, user) combinations it matches are ignored below
+            result = await db.execute(
+                select(RoomMember.room_id, RoomMember.user_id, RoomMember.last_read_at).where(
+                    RoomMember.room_id.in_({room_id for room_id, _ in pending}),
+                    RoomMember.user_id.in_({user_id for _, user_id in pending})
+                )
+            )
+            current = {(row.room_id, row.user_id): row.last_read_at for row in result}
+
+            rows = []
+            for (room_id, user_id), message_id in pending.items():
+                message = messages.get(message_id)
+                # Ignore ids that do not exist or belong to another room, and non-members
+                if message is None or message.room_id != room_id or (room_id, user_id) not in current:
+                    continue
+                last_read_at = current[(room_id, user_id)]
+                if last_read_at is not None and last_read_at >= message.created_at:
+                    continue
+                rows.append({
+                    "b_room_id": room_id,
+                    "b_user_id": user_id,
+                    "b_read_at": message.created_at,
+                    "message_id": message_id,
+                })
+            if not rows:
+                return
+
+            # Watermarks only move forward (also guards against another worker's flush).
+            # The unread counter becomes what is left after the new watermark: usually
+            # nothing, and counting it is a short range read
+            table = RoomMember.__table__
+            await db.execute(
+                update(table).where(
+                    table.c.room_id == bindparam("b_room_id"),
+                    table.c.user_id == bindparam("b_user_id"),
+                    or_(table.c.last_read_at.is_(None), table.c.last_read_at < bindparam("b_read_at"))
+                ).values(
+                    last_read_at=bindparam("b_read_at"),
+                    unread_count=recount_expression(bindparam("b_read_at"))
+                ),
+                [{k: v for k, v in row.items() if k.startswith("b_")} for row in rows]
+            )
+            await db.commit()
+
+        for row in rows:
+            await self.manager.broadcast_to_room(row["b_room_id"], {
+                "type": "read_up_to",
+                "room_id": row["b_room_id"],
+                "user_id": row["b_user_id"],
+                "message_id": row["message_id"],
+                "read_at": row["b_read_at"].isoformat(),
+            })
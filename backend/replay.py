@@ -0,0 +1,82 @@
+import os
+from collections import OrderedDict, deque
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from ws_codec import Frame
+
+load_dotenv()
+
+# Broadcast frames kept per room for reconnect resume
+REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "256"))
+# Rooms with a buffer; the least recently active room is dropped beyond this
+REPLAY_MAX_ROOMS = int(os.getenv("WS_REPLAY_MAX_ROOMS", "10000"))
+# Messages sent from the database when a gap is larger than the buffer
+REPLAY_DB_LIMIT = int(os.getenv("WS_REPLAY_DB_LIMIT", "500"))
+
+ReplayEntry = Tuple[int, Optional[int], Frame]
+
+
+class RoomLog:
+    __slots__ = ("floor", "entries")
+
+    def __init__(self, floor: int, size: int):
+        # Every frame of this room with seq > floor is still in entries
+        self.floor = floor
+        self.entries: deque = deque(maxlen=size)
+
+
+class RoomReplayBuffer:
+    """Recent room broadcasts, each tagged with a sequence number.
+
+    Sequence numbers come from one counter per worker, so they increase within
+    a room (with gaps) and are never reused after a room's log is dropped. A
+    client that saw seq N can be brought up to date from memory as long as
+    nothing after N has fallen out of the room's log. Sequence numbers are only
+    meaningful on the worker that issued them (see ConnectionManager.worker_id).
+    """
+
+    def __init__(self, size: int = REPLAY_BUFFER_SIZE, max_rooms: int = REPLAY_MAX_ROOMS):
+        self.size = size
+        self.max_rooms = max_rooms
+        self.rooms: "OrderedDict[int, RoomLog]" = OrderedDict()
+        self.seq = 0
+        # Rooms without a log have had no frames after this seq
+        self.dropped_floor = 0
+
+    def record(self, room_id: int, message: dict, exclude_user_id: int = None) -> Frame:
+        # Returns the frame to deliver: the message stamped with its seq
+        self.seq += 1
+        frame = Frame({**message, "seq": self.seq})
+        log = self.rooms.get(room_id)
+        if log is None:
+            # Nothing of this room happened after dropped_floor, so a client at any
+            # seq since then has missed only this frame
+            log = self.rooms[room_id] = RoomLog(self.dropped_floor, self.size)
+            if len(self.rooms) > self.max_rooms:
+                _, dropped = self.rooms.popitem(last=False)
+                self.dropped_floor = max(self.dropped_floor, dropped.entries[-1][0])
+        else:
+            self.rooms.move_to_end(room_id)
+            if len(log.entries) == log.entries.maxlen:
+                log.floor = log.entries[0][0]
+        log.entries.append((self.seq, exclude_user_id, frame))
+        return frame
+
+    def last_seq(self, room_id: int) -> int:
+        # Baseline for a client that is up to date with this room right now
+        log = self.rooms.get(room_id)
+        if log is None or not log.entries:
+            return self.seq
+        return log.entries[-1][0]
+
+    def since(self, room_id: int, seq: int, user_id: int) -> Optional[List[Frame]]:
+        # Frames after seq, or None if some of them are no longer buffered
+        log = self.rooms.get(room_id)
+        if log is None:
+            return [] if seq >= self.dropped_floor else None
+        if seq < log.floor:
+            return None
+        return [frame for entry_seq, exclude_user_id, frame in log.entries
+                if entry_seq > seq and exclude_user_id != user_id]
@@ -9,6 +9,10 @@ def reset_db():
             print("Removing old SQLite file...")
             try:
                 os.remove("webchat.db")
+                # WAL mode sidecar files
+                for suffix in ("-wal", "-shm"):
+                    if os.path.exists("webchat.db" + suffix):
+                        os.remove("webchat.db" + suffix)
             except PermissionError:
                 print("Could not remove webchat.db. Make sure the server is stopped.")
                 return False
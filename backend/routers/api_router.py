@@ -1,18 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from database import get_db
-from models import User, Message, ReadReceipt
+from database import get_async_db, get_async_read_db
+from models import User, Message, RoomMember, FileAttachment
 from schemas import (
     UserResponse,
     UserProfileUpdate,
     MessageResponse,
-    MessageWithSender,
+    MessagePage,
     ReadReceiptCreate,
     ReadReceiptResponse
 )
 from auth import get_current_user
+from routers.websocket_router import is_room_member, manager, read_watermarks
 
 router = APIRouter(prefix="/api", tags=["api"])
 
@@ -22,8 +24,8 @@ async def get_current_user_profile(current_user: User = Depends(get_current_user
     return current_user
 
 @router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -33,84 +35,169 @@ async def get_users(
     skip: int = Query(0, ge=0),
     limit: int = Query(50, le=100),
     search: str = Query(None, min_length=1),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    query = db.query(User)
+    query = select(User)
     
     if search:
         search_term = f"%{search}%"
-        query = query.filter(
+        query = query.where(
             (User.username.ilike(search_term)) | 
             (User.display_name.ilike(search_term))
         )
     
-    users = query.offset(skip).limit(limit).all()
+    result = await db.execute(query.offset(skip).limit(limit))
+    users = result.scalars().all()
     return users
 
 @router.put("/users/me/profile", response_model=UserResponse)
 async def update_profile(
     profile_data: UserProfileUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
+    # current_user is a cached principal; the change goes through the User row
+    user = await db.get(User, current_user.id)
     if profile_data.display_name is not None:
-        current_user.display_name = profile_data.display_name
+        user.display_name = profile_data.display_name
     if profile_data.avatar_url is not None:
-        current_user.avatar_url = profile_data.avatar_url
+        user.avatar_url = profile_data.avatar_url
     if profile_data.bio is not None:
-        current_user.bio = profile_data.bio
+        user.bio = profile_data.bio
     if profile_data.theme_preference is not None:
-        current_user.theme_preference = profile_data.theme_preference
+        user.theme_preference = profile_data.theme_preference
     
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    await db.commit()
+    await db.refresh(user)
+    await manager.invalidate_principal(user.id)
+    return user
 
 # Message endpoints
-@router.get("/messages", response_model=List[MessageWithSender])
+# Columns MessageWithSender needs, selected directly for history pages
+HISTORY_MESSAGE_COLUMNS = (
+    Message.id, Message.content, Message.sender_id, Message.room_id, Message.message_type,
+    Message.created_at, Message.updated_at, Message.is_deleted, Message.is_edited,
+)
+HISTORY_SENDER_COLUMNS = (
+    User.id, User.username, User.email, User.display_name, User.avatar_url, User.bio,
+    User.theme_preference, User.is_active, User.created_at, User.last_seen,
+)
+HISTORY_ATTACHMENT_COLUMNS = (
+    FileAttachment.id, FileAttachment.filename, FileAttachment.file_path, FileAttachment.file_size,
+    FileAttachment.content_type, FileAttachment.uploaded_at,
+)
+HISTORY_MESSAGE_KEYS = [column.key for column in HISTORY_MESSAGE_COLUMNS]
+HISTORY_SENDER_KEYS = [column.key for column in HISTORY_SENDER_COLUMNS]
+HISTORY_ATTACHMENT_KEYS = [column.key for column in HISTORY_ATTACHMENT_COLUMNS]
+
+@router.get("/messages", response_model=MessagePage)
 async def get_messages(
-    room_id: str,
-    skip: int = Query(0, ge=0),
-    limit: int = Query(50, le=100),
-    db: Session = Depends(get_db),
+    room_id: int,
+    before_id: Optional[int] = Query(None, description="Page of messages older than this one"),
+    after_id: Optional[int] = Query(None, description="Page of messages newer than this one"),
+    limit: int = Query(50, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    messages = db.query(Message).filter(
-        Message.room_id == room_id,
-        Message.is_deleted == False
-    ).order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return messages
+    # Keyset pagination over (created_at, id), served in order by ix_messages_room_created_id:
+    # every page costs the same, and rows arriving meanwhile cannot shift a page
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Pass before_id or after_id, not both")
+    # Served from membership_cache; checked against the primary, never a lagging replica
+    if not await is_room_member(room_id, current_user.id):
+        raise HTTPException(status_code=403, detail="Not a member of this room")
+
+    # Senders come in the same query, attachments in one more: the page is at most two
+    # queries whatever its size, and rows are turned into dicts without ORM instances
+    query = select(*HISTORY_MESSAGE_COLUMNS, *HISTORY_SENDER_COLUMNS).join(User, User.id == Message.sender_id).where(
+        Message.room_id == room_id, Message.is_deleted == False
+    )
+    key = tuple_(Message.created_at, Message.id)
+    cursor = before_id if before_id is not None else after_id
+    if cursor is not None:
+        # The cursor message's own position; an id from another room matches nothing
+        anchor = tuple_(
+            select(Message.created_at).where(Message.id == cursor, Message.room_id == room_id).scalar_subquery(),
+            cursor
+        )
+        query = query.where(key > anchor if after_id is not None else key < anchor)
+    if after_id is not None:
+        query = query.order_by(Message.created_at, Message.id)
+    else:
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    # One extra row tells whether another page exists
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    messages = []
+    senders = {}
+    by_id = {}
+    split = len(HISTORY_MESSAGE_COLUMNS)
+    for row in rows:
+        message = dict(zip(HISTORY_MESSAGE_KEYS, row[:split]))
+        sender = senders.get(message["sender_id"])
+        if sender is None:
+            sender = senders[message["sender_id"]] = dict(zip(HISTORY_SENDER_KEYS, row[split:]))
+        message["sender"] = sender
+        message["attachments"] = []
+        messages.append(message)
+        by_id[message["id"]] = message
+
+    if by_id:
+        result = await db.execute(
+            select(*HISTORY_ATTACHMENT_COLUMNS, FileAttachment.message_id).where(
+                FileAttachment.message_id.in_(list(by_id))
+            ).order_by(FileAttachment.id)
+        )
+        for row in result:
+            by_id[row.message_id]["attachments"].append(dict(zip(HISTORY_ATTACHMENT_KEYS, row[:-1])))
+
+    return {"messages": messages, "next_cursor": messages[-1]["id"] if has_more else None}
 
 @router.get("/messages/{message_id}/read-receipts", response_model=List[ReadReceiptResponse])
 async def get_message_read_receipts(
     message_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    receipts = db.query(ReadReceipt).filter(ReadReceipt.message_id == message_id).all()
-    return receipts
+    # Everyone in the room (except the sender) whose watermark is at or past this message
+    message = await db.get(Message, message_id)
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    if await db.get(RoomMember, (message.room_id, current_user.id)) is None:
+        raise HTTPException(status_code=403, detail="Not a member of this room")
+
+    result = await db.execute(select(RoomMember.user_id, RoomMember.last_read_at).where(
+        RoomMember.room_id == message.room_id,
+        RoomMember.user_id != message.sender_id,
+        RoomMember.last_read_at >= message.created_at
+    ))
+
+    return [
+        ReadReceiptResponse(message_id=message_id, user_id=user_id, read_at=read_at)
+        for user_id, read_at in result
+    ]
 
 @router.post("/messages/{message_id}/read", response_model=ReadReceiptResponse)
 async def mark_message_read(
     message_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    # Check if already read
-    existing = db.query(ReadReceipt).filter(
-        ReadReceipt.message_id == message_id,
-        ReadReceipt.user_id == current_user.id
-    ).first()
-    
-    if existing:
-        return existing
-    
-    # Create new read receipt
-    receipt = ReadReceipt(message_id=message_id, user_id=current_user.id)
-    db.add(receipt)
-    db.commit()
-    db.refresh(receipt)
-    
-    return receipt
+    message = await db.get(Message, message_id)
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    member = await db.get(RoomMember, (message.room_id, current_user.id))
+    if member is None:
+        raise HTTPException(status_code=403, detail="Not a member of this room")
+
+    # Reading a message reads everything before it: advance the watermark
+    read_watermarks.advance(message.room_id, current_user.id, message_id)
+    # Report the watermark as the flush leaves it (it never moves back), as the list endpoint does
+    read_at = message.created_at
+    if member.last_read_at is not None and member.last_read_at > read_at:
+        read_at = member.last_read_at
+    return ReadReceiptResponse(message_id=message_id, user_id=current_user.id, read_at=read_at)
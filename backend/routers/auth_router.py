@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from database import get_db
+from database import get_async_db
 from models import User
 from schemas import UserCreate, UserLogin, Token, UserResponse
 from auth import (
     get_password_hash,
+    run_password_job,
     authenticate_user,
     create_access_token,
     get_current_user,
@@ -16,38 +18,41 @@ from auth import (
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if username exists
-    if db.query(User).filter(User.username == user_data.username).first():
+    result = await db.execute(select(User.id).where(User.username == user_data.username))
+    if result.first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
     # Check if email exists
-    if db.query(User).filter(User.email == user_data.email).first():
+    result = await db.execute(select(User.id).where(User.email == user_data.email))
+    if result.first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
     # Create new user
+    hashed_password = await run_password_job(get_password_hash, user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         display_name=user_data.display_name or user_data.username
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return new_user
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
-    user = authenticate_user(db, user_data.username, user_data.password)
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, user_data.username, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -57,7 +62,8 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        # uid lets a principal cache miss look the user up by primary key
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
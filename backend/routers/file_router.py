@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import aiofiles
 import os
 import hashlib
 from datetime import datetime
 
-from database import get_db
+from database import get_async_db
 from models import User, Message, FileAttachment, RoomMember
 from auth import get_current_user
+from unread_counts import increment_unread_counts
 # Broadcast for new attachment message
 from routers.websocket_router import manager
 
@@ -21,14 +22,11 @@ if not os.path.exists(UPLOAD_DIR):
 async def upload_file(
     room_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     # Check room access first
-    member = db.query(RoomMember).filter(
-        RoomMember.room_id == room_id,
-        RoomMember.user_id == current_user.id
-    ).first()
+    member = await db.get(RoomMember, (room_id, current_user.id))
     if not member:
          raise HTTPException(status_code=403, detail="Access denied to room")
 
@@ -170,8 +168,7 @@ async def upload_file(
         content=f"Sent a file: {file.filename}" 
     )
     db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
+    await db.flush()
     
     # Create Attachment Record
     attachment = FileAttachment(
@@ -181,8 +178,10 @@ async def upload_file(
         file_size=size,
         content_type=final_content_type 
     )
+    # Message, attachment and recipients' unread counters commit together
     db.add(attachment)
-    db.commit()
+    await increment_unread_counts(db, [new_message])
+    await db.commit()
     
     # Broadcast
     # We construct specific payload for file
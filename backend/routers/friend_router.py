@@ -1,36 +1,50 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy import select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List
 
-from database import get_db
+from database import get_async_db, get_async_read_db
 from models import User, FriendRequest, FriendRequestStatus
 from schemas import FriendRequestResponse, FriendRequestCreate, UserResponse, FriendResponse
 from auth import get_current_user
+# Accepted requests change friend lists cached by the presence engine
+from routers.websocket_router import presence
 
 router = APIRouter(prefix="/api/friends", tags=["friends"])
 
+# FriendRequestResponse embeds both users; async sessions cannot lazy-load them
+WITH_USERS = (selectinload(FriendRequest.sender), selectinload(FriendRequest.receiver))
+
+async def load_request(db: AsyncSession, request_id: int):
+    result = await db.execute(
+        select(FriendRequest).where(FriendRequest.id == request_id)
+        .options(*WITH_USERS).execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
 @router.post("/request/{user_id}", response_model=FriendRequestResponse)
 async def send_friend_request(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot add yourself as a friend")
     
-    target_user = db.query(User).filter(User.id == user_id).first()
+    target_user = await db.get(User, user_id)
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
         
     # Check if request already exists
-    existing_request = db.query(FriendRequest).filter(
+    result = await db.execute(select(FriendRequest).where(
         or_(
             and_(FriendRequest.sender_id == current_user.id, FriendRequest.receiver_id == user_id),
             and_(FriendRequest.sender_id == user_id, FriendRequest.receiver_id == current_user.id)
         ),
         FriendRequest.status != FriendRequestStatus.REJECTED # Allow re-sending if rejected? Maybe not for now.
-    ).first()
+    ))
+    existing_request = result.scalars().first()
     
     if existing_request:
         if existing_request.status == FriendRequestStatus.ACCEPTED:
@@ -46,18 +60,17 @@ async def send_friend_request(
         status=FriendRequestStatus.PENDING
     )
     db.add(new_request)
-    db.commit()
-    db.refresh(new_request)
-    return new_request
+    await db.commit()
+    return await load_request(db, new_request.id)
 
 @router.put("/request/{request_id}/{action}", response_model=FriendRequestResponse)
 async def respond_to_friend_request(
     request_id: int,
     action: str, # accept, reject
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    request = db.query(FriendRequest).filter(FriendRequest.id == request_id).first()
+    request = await db.get(FriendRequest, request_id)
     if not request:
         raise HTTPException(status_code=404, detail="Friend request not found")
         
@@ -74,78 +87,79 @@ async def respond_to_friend_request(
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
         
-    db.commit()
-    db.refresh(request)
-    return request
+    await db.commit()
+    if request.status == FriendRequestStatus.ACCEPTED:
+        await presence.invalidate_friends(request.sender_id, request.receiver_id)
+    return await load_request(db, request.id)
 
 @router.get("/", response_model=List[UserResponse])
 async def list_friends(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     # Find all accepted requests where user is sender OR receiver
-    friends_query = db.query(User).join(
+    friends_query = select(User).join(
         FriendRequest,
         or_(
             and_(FriendRequest.sender_id == User.id, FriendRequest.receiver_id == current_user.id),
             and_(FriendRequest.receiver_id == User.id, FriendRequest.sender_id == current_user.id)
         )
-    ).filter(
+    ).where(
         FriendRequest.status == FriendRequestStatus.ACCEPTED
     )
     
-    return friends_query.all()
+    result = await db.execute(friends_query)
+    return result.scalars().all()
 
 @router.get("/requests/received", response_model=List[FriendRequestResponse])
 async def list_received_requests(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    requests = db.query(FriendRequest).filter(
+    result = await db.execute(select(FriendRequest).where(
         FriendRequest.receiver_id == current_user.id,
         FriendRequest.status == FriendRequestStatus.PENDING
-    ).all()
-    # Eager load sender manually if needed, or rely on lazy loading (pydantic will trigger it)
-    # Actually better to eager load
-    # ... but with Pydantic from_attributes=True and ORM, it should work.
-    return requests
+    ).options(*WITH_USERS))
+    return result.scalars().all()
 
 @router.get("/requests/sent", response_model=List[FriendRequestResponse])
 async def list_sent_requests(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    requests = db.query(FriendRequest).filter(
+    result = await db.execute(select(FriendRequest).where(
         FriendRequest.sender_id == current_user.id,
         FriendRequest.status == FriendRequestStatus.PENDING
-    ).all()
-    return requests
+    ).options(*WITH_USERS))
+    return result.scalars().all()
 
 @router.get("/search", response_model=List[FriendResponse])
 async def search_users(
     query: str = Query(..., min_length=1),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
     # Search users by username or display name
     search_term = f"%{query}%"
-    users = db.query(User).filter(
+    result = await db.execute(select(User).where(
         (User.username.ilike(search_term)) | 
         (User.display_name.ilike(search_term)),
         User.id != current_user.id # Exclude self
-    ).limit(20).all()
+    ).limit(20))
+    users = result.scalars().all()
     
     # Determine friendship status for each
     results = []
     for user in users:
         status = "none"
         # Check if friend or pending
-        rel = db.query(FriendRequest).filter(
+        rel_result = await db.execute(select(FriendRequest).where(
             or_(
                 and_(FriendRequest.sender_id == current_user.id, FriendRequest.receiver_id == user.id),
                 and_(FriendRequest.sender_id == user.id, FriendRequest.receiver_id == current_user.id)
             )
-        ).first()
+        ))
+        rel = rel_result.scalars().first()
         
         if rel:
             if rel.status == FriendRequestStatus.ACCEPTED:
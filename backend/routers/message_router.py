@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta
 from typing import Optional
 
-from database import get_db
+from database import get_async_db
 from models import User, Message, RoomMember
 from schemas import MessageCreate, MessageResponse, MessageUpdate
 from auth import get_current_user
@@ -20,10 +22,14 @@ router = APIRouter(prefix="/messages", tags=["messages"])
 async def edit_message(
     message_id: int,
     message_update: MessageUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    message = db.query(Message).filter(Message.id == message_id).first()
+    # attachments are part of MessageResponse; load them up front
+    result = await db.execute(
+        select(Message).where(Message.id == message_id).options(selectinload(Message.attachments))
+    )
+    message = result.scalars().first()
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
         
@@ -39,8 +45,7 @@ async def edit_message(
     message.content = message_update.content
     message.is_edited = True
     message.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(message)
+    await db.commit()
     
     # Broadcast update
     update_payload = {
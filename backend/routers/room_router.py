@@ -1,22 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from datetime import datetime
 
-from database import get_db
-from models import User, Room, RoomMember, RoomType
-from schemas import RoomCreate, RoomResponse, UserResponse
+from database import get_async_db, get_async_read_db
+from models import User, Room, RoomMember, RoomType, Message
+from schemas import RoomCreate, RoomResponse, UserResponse, InboxPage
 from auth import get_current_user
+# Membership changes must invalidate the WebSocket permission cache on every worker
+from routers.websocket_router import manager
 
 router = APIRouter(prefix="/rooms", tags=["rooms"])
 
+async def load_room(db: AsyncSession, room_id: int):
+    # Room with members and their users, as RoomResponse needs (async sessions cannot lazy-load)
+    result = await db.execute(
+        select(Room).where(Room.id == room_id).options(
+            selectinload(Room.members).selectinload(RoomMember.user)
+        ).execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
 @router.post("/dm", response_model=RoomResponse)
 async def create_dm_room(
     target_user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     # Check if target user exists
-    target_user = db.query(User).filter(User.id == target_user_id).first()
+    target_user = await db.get(User, target_user_id)
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -28,37 +42,38 @@ async def create_dm_room(
     # 2. Get Room IDs where target_user is member
     # 3. Intersect + Filter by type=DIRECT
     
-    my_rooms = db.query(RoomMember.room_id).filter(RoomMember.user_id == current_user.id).subquery()
-    target_rooms = db.query(RoomMember.room_id).filter(RoomMember.user_id == target_user_id).subquery()
+    my_rooms = select(RoomMember.room_id).where(RoomMember.user_id == current_user.id)
+    target_rooms = select(RoomMember.room_id).where(RoomMember.user_id == target_user_id)
     
-    existing_dm = db.query(Room).filter(
+    result = await db.execute(select(Room.id).where(
         Room.type == RoomType.DIRECT,
         Room.id.in_(my_rooms),
         Room.id.in_(target_rooms)
-    ).first()
+    ))
+    existing_dm_id = result.scalars().first()
     
-    if existing_dm:
-        return existing_dm
+    if existing_dm_id:
+        return await load_room(db, existing_dm_id)
 
     # Create new DM Room
     new_room = Room(type=RoomType.DIRECT, created_by=current_user.id)
     db.add(new_room)
-    db.commit()
-    db.refresh(new_room)
+    await db.commit()
+    await db.refresh(new_room)
     
     # Add members
     member1 = RoomMember(room_id=new_room.id, user_id=current_user.id, role="admin")
     member2 = RoomMember(room_id=new_room.id, user_id=target_user_id, role="member")
     db.add_all([member1, member2])
-    db.commit()
-    db.refresh(new_room)
+    await db.commit()
+    await manager.invalidate_membership(new_room.id, [current_user.id, target_user_id])
     
-    return new_room
+    return await load_room(db, new_room.id)
 
 @router.post("/group", response_model=RoomResponse)
 async def create_group_room(
     room_data: RoomCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     new_room = Room(
@@ -67,8 +82,8 @@ async def create_group_room(
         created_by=current_user.id
     )
     db.add(new_room)
-    db.commit()
-    db.refresh(new_room)
+    await db.commit()
+    await db.refresh(new_room)
     
     # Add creator as admin
     admin_member = RoomMember(room_id=new_room.id, user_id=current_user.id, role="admin")
@@ -81,33 +96,133 @@ async def create_group_room(
             member = RoomMember(room_id=new_room.id, user_id=uid, role="member")
             db.add(member)
             
-    db.commit()
-    db.refresh(new_room)
-    return new_room
+    await db.commit()
+    await manager.invalidate_membership(new_room.id)
+    return await load_room(db, new_room.id)
 
 @router.get("/", response_model=List[RoomResponse])
 async def get_my_rooms(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
     # Eager load members and their user info for display
-    rooms = db.query(Room).join(RoomMember).filter(
-        RoomMember.user_id == current_user.id
-    ).options(
-        joinedload(Room.members).joinedload(RoomMember.user)
-    ).all()
+    result = await db.execute(
+        select(Room).join(RoomMember).where(
+            RoomMember.user_id == current_user.id
+        ).options(
+            selectinload(Room.members).selectinload(RoomMember.user)
+        )
+    )
+    rooms = result.scalars().all()
     
     return rooms
 
+# Members shown per room in the inbox, and characters of the last message
+INBOX_PREVIEW_MEMBERS = 3
+INBOX_PREVIEW_CHARS = 200
+
+def parse_inbox_cursor(cursor: str):
+    # "<last activity, ISO 8601>|<room id>" as returned in next_cursor
+    try:
+        activity, room_id = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(activity), int(room_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/inbox", response_model=InboxPage)
+async def get_inbox(
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    # Two queries for a page of any size: rooms with their last message and unread
+    # counter, then a few members of each. Nothing per room, no full member lists
+    me = current_user.id
+
+    # Newest message of each room, read off ix_messages_room_created_id
+    last_message_id = select(Message.id).where(
+        Message.room_id == Room.id,
+        Message.is_deleted == False
+    ).order_by(Message.created_at.desc(), Message.id.desc()).limit(1).correlate(Room).scalar_subquery()
+    mine = select(
+        Room.id, Room.name, Room.type, Room.created_at, RoomMember.last_read_at, RoomMember.unread_count,
+        last_message_id.label("last_message_id")
+    ).join(RoomMember, and_(RoomMember.room_id == Room.id, RoomMember.user_id == me)).subquery()
+
+    # Rooms without messages sort by when they were created
+    activity = func.coalesce(Message.created_at, mine.c.created_at)
+    query = select(
+        mine.c.id, mine.c.name, mine.c.type, mine.c.last_read_at, mine.c.unread_count,
+        Message.id.label("message_id"),
+        func.substr(Message.content, 1, INBOX_PREVIEW_CHARS).label("content"),
+        Message.sender_id, Message.message_type, Message.created_at.label("message_created_at"),
+        activity.label("activity")
+    ).outerjoin(Message, Message.id == mine.c.last_message_id)
+    if cursor is not None:
+        cursor_activity, cursor_room_id = parse_inbox_cursor(cursor)
+        query = query.where(or_(
+            activity < cursor_activity,
+            and_(activity == cursor_activity, mine.c.id < cursor_room_id)
+        ))
+    rows = (await db.execute(query.order_by(activity.desc(), mine.c.id.desc()).limit(limit + 1))).all()
+
+    # One extra row tells whether another page exists
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    rooms = {}
+    for row in rows:
+        rooms[row.id] = {
+            "id": row.id,
+            "name": row.name,
+            "type": row.type,
+            "members": [],
+            "member_count": 0,
+            "last_message": {
+                "id": row.message_id,
+                "content": row.content,
+                "sender_id": row.sender_id,
+                "message_type": row.message_type,
+                "created_at": row.message_created_at,
+            } if row.message_id is not None else None,
+            "unread_count": row.unread_count,
+            "last_read_at": row.last_read_at,
+        }
+
+    if rooms:
+        # First few members per room (others before the caller, then by join time) and the total
+        ranked = select(
+            RoomMember.room_id, RoomMember.user_id, User.username, User.display_name, User.avatar_url,
+            func.row_number().over(
+                partition_by=RoomMember.room_id,
+                order_by=(case((RoomMember.user_id == me, 1), else_=0), RoomMember.joined_at, RoomMember.user_id)
+            ).label("position"),
+            func.count().over(partition_by=RoomMember.room_id).label("member_count")
+        ).join(User, User.id == RoomMember.user_id).where(RoomMember.room_id.in_(list(rooms))).subquery()
+        result = await db.execute(
+            select(ranked).where(ranked.c.position <= INBOX_PREVIEW_MEMBERS).order_by(ranked.c.room_id, ranked.c.position)
+        )
+        for row in result:
+            room = rooms[row.room_id]
+            room["member_count"] = row.member_count
+            room["members"].append({
+                "user_id": row.user_id,
+                "username": row.username,
+                "display_name": row.display_name,
+                "avatar_url": row.avatar_url,
+            })
+
+    next_cursor = f"{rows[-1].activity.isoformat()}|{rows[-1].id}" if has_more else None
+    return {"rooms": list(rooms.values()), "next_cursor": next_cursor}
+
 @router.get("/{room_id}", response_model=RoomResponse)
 async def get_room_details(
     room_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    room = db.query(Room).options(
-        joinedload(Room.members).joinedload(RoomMember.user)
-    ).filter(Room.id == room_id).first()
+    room = await load_room(db, room_id)
     
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
@@ -122,34 +237,32 @@ async def get_room_details(
 @router.post("/{room_id}/leave")
 async def leave_room(
     room_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = await db.get(Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
         
     # Check if member
-    member = db.query(RoomMember).filter(
-        RoomMember.room_id == room_id,
-        RoomMember.user_id == current_user.id
-    ).first()
+    member = await db.get(RoomMember, (room_id, current_user.id))
     
     if not member:
         raise HTTPException(status_code=400, detail="Not a member of this room")
         
-    db.delete(member)
-    db.commit()
+    await db.delete(member)
+    await db.commit()
+    await manager.invalidate_membership(room_id, [current_user.id])
     
     return {"detail": "Successfully left the room"}
 
 @router.delete("/{room_id}")
 async def delete_room(
     room_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = await db.get(Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
         
@@ -159,7 +272,8 @@ async def delete_room(
             detail="Only the group creator can delete this room"
         )
         
-    db.delete(room)
-    db.commit()
+    await db.delete(room)
+    await db.commit()
+    await manager.invalidate_membership(room_id)
     
     return {"detail": "Room deleted successfully"}
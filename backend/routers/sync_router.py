@@ -1,19 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List
 from datetime import datetime
 
-from database import get_db
+from database import get_async_db
 from models import Message, User
 from schemas import SyncRequest, SyncResponse, MessageResponse, MessageWithSender
 from auth import get_current_user
+from unread_counts import increment_unread_counts
 
 router = APIRouter(prefix="/api", tags=["sync"])
 
 @router.post("/sync", response_model=SyncResponse)
 async def sync_messages(
     sync_data: SyncRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -28,32 +31,38 @@ async def sync_messages(
             sender_id=current_user.id,
             room_id=msg.room_id,
             message_type=msg.message_type,
-            created_at=msg.client_timestamp
+            created_at=msg.client_timestamp,
+            attachments=[]
         )
         db.add(new_message)
-        db.flush()  # Get ID without committing
+        await db.flush()  # Get ID without committing
         synced_messages.append(new_message)
     
-    db.commit()
+    # One counter update for everything synced, committed with the messages
+    await increment_unread_counts(db, synced_messages)
+    await db.commit()
     
     # Get new messages since last sync
     new_messages = []
     if sync_data.last_sync_time:
         # Get all messages newer than last sync (across all rooms user has access to)
         # For simplicity, we'll get messages from rooms the user has sent messages in
-        user_rooms = db.query(Message.room_id).filter(
+        result = await db.execute(select(Message.room_id).where(
             Message.sender_id == current_user.id
-        ).distinct().all()
-        room_ids = [room[0] for room in user_rooms]
+        ).distinct())
+        room_ids = result.scalars().all()
         
         if room_ids:
-            messages = db.query(Message).filter(
+            result = await db.execute(select(Message).where(
                 Message.room_id.in_(room_ids),
                 Message.created_at > sync_data.last_sync_time,
                 Message.sender_id != current_user.id  # Don't return own messages
-            ).order_by(Message.created_at.asc()).all()
+            ).options(
+                selectinload(Message.sender),
+                selectinload(Message.attachments)
+            ).order_by(Message.created_at.asc()))
             
-            new_messages = messages
+            new_messages = result.scalars().all()
     
     return SyncResponse(
         synced_messages=synced_messages,
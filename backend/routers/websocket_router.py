@@ -1,152 +1,295 @@
 import asyncio
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from sqlalchemy.orm import Session
-from typing import Dict, List, Set
-import json
-from datetime import datetime
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from typing import Callable, Dict, List, Optional
+import time
+import uuid
 
-from database import get_db, SessionLocal
-from models import Message, User, ReadReceipt, Room, RoomMember
-from schemas import MessageCreate
+from database import AsyncSessionLocal
+from auth import principal_from_token
+from backplane import Backplane, create_backplane
+from membership_cache import membership_cache
+from principal_cache import principal_cache
+import metrics
+from message_writer import message_writer
+from calls import CallRegistry
+from connections import (
+    Connection, ConnectionRegistry, encode_frame, SLOW_CONSUMER_POLICY, SLOW_CONSUMER_CLOSE_CODE,
+    HEARTBEAT_INTERVAL, HEARTBEAT_MAX_MISSED, HEARTBEAT_CLOSE_CODE
+)
+from ws_codec import Frame, negotiate, receive_message
+from models import Message, RoomMember
+from presence import PresenceEngine
+from rate_limit import rate_limiter
+from read_receipts import ReadWatermarks
+from replay import RoomReplayBuffer, REPLAY_DB_LIMIT
 
 router = APIRouter(tags=["websocket"])
 
+EVICTIONS = metrics.counter("webchat_ws_evictions_total", "Connections closed by the server", ("reason",))
+FANOUT_RECIPIENTS = metrics.histogram(
+    "webchat_ws_fanout_recipients", "Local sockets reached per room broadcast",
+    (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+FANOUT_SECONDS = metrics.histogram(
+    "webchat_ws_fanout_duration_seconds", "Time to enqueue one room broadcast on this worker",
+    (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+)
+
 class ConnectionManager:
-    def __init__(self):
-        # Maps user_id to list of websocket connections
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-        # Maps room_id (int) to set of user_ids (for quick lookup of who is online in a room)
+    def __init__(self, backplane: Backplane = None):
+        # Connections per user plus room <-> user subscription indexes.
         # Note: We rely on DB for permission check, this is just for broadcasting to *connected* users.
-        self.room_subscribers: Dict[int, Set[int]] = {}
+        self.registry = ConnectionRegistry()
+        # Deliveries are made locally and published so other workers reach their own sockets
+        self.backplane = backplane or create_backplane()
+        self.worker_id = uuid.uuid4().hex
+        # Recent room frames by seq, for clients resuming after a reconnect
+        self.replay = RoomReplayBuffer()
+        # Extra backplane ops owned by other subsystems (e.g. presence)
+        self.envelope_handlers: Dict[str, Callable[[dict], None]] = {}
+        self.heartbeat_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.backplane.start(self._on_backplane_envelope)
+        if self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            try:
+                await self.heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self.heartbeat_task = None
+        await self.backplane.stop()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Heartbeat sweep failed: {e}")
+
+    def sweep(self, now: float = None) -> int:
+        # Evict sockets whose writer gave up or that missed too many heartbeats;
+        # ping the ones that have been quiet for a whole interval
+        now = time.monotonic() if now is None else now
+        heartbeat = None
+        evicted = 0
+        for connection in self.registry.all_connections():
+            idle = now - connection.last_activity
+            if connection.closed or idle >= HEARTBEAT_INTERVAL * HEARTBEAT_MAX_MISSED:
+                reason = "send_failures" if connection.closed else "heartbeat"
+                print(f"Evicting dead connection (user {connection.user_id}, {reason}, idle {idle:.0f}s)")
+                EVICTIONS.inc(1, (reason,))
+                connection.close(HEARTBEAT_CLOSE_CODE)
+                self.disconnect(connection.websocket, connection.user_id)
+                evicted += 1
+            elif idle >= HEARTBEAT_INTERVAL:
+                if heartbeat is None:
+                    heartbeat = encode_frame({"type": "heartbeat"})
+                connection.send_frame(heartbeat, priority=True)
+        return evicted
+
+    def _on_backplane_envelope(self, envelope: dict):
+        # Replay another worker's delivery against our local sockets
+        if envelope.get("origin") == self.worker_id:
+            return
+        op = envelope.get("op")
+        frame = Frame.from_json(envelope["frame"]) if envelope.get("frame") is not None else None
+        if op == "room":
+            # Re-stamped with this worker's seq before it reaches our sockets
+            frame = self.replay.record(envelope["room_id"], frame.message, envelope.get("exclude_user_id"))
+            self._fan_out_room(envelope["room_id"], frame, envelope.get("exclude_user_id"))
+        elif op == "users":
+            for user_id in envelope["user_ids"]:
+                self._send_frame_to_user(user_id, frame, envelope.get("priority", False))
+        elif op == "connection":
+            connection = self.registry.get(envelope["connection_id"])
+            if connection is not None:
+                self._deliver(connection, frame, envelope.get("priority", False))
+        elif op == "invalidate_membership":
+            membership_cache.invalidate(envelope["room_id"], envelope.get("user_ids"))
+        elif op == "invalidate_principal":
+            principal_cache.invalidate(envelope["user_id"])
+        elif op in self.envelope_handlers:
+            self.envelope_handlers[op](envelope)
+
+    def register_envelope_handler(self, op: str, handler: Callable[[dict], None]):
+        self.envelope_handlers[op] = handler
+
+    async def publish_event(self, op: str, **fields):
+        # Frame-less envelope for another subsystem's handler on the other workers
+        await self._publish(op, None, **fields)
+
+    async def invalidate_membership(self, room_id: int, user_ids: List[int] = None):
+        # Called by the room routers whenever membership changes; reaches every worker's cache
+        membership_cache.invalidate(room_id, user_ids)
+        await self._publish("invalidate_membership", None, room_id=room_id, user_ids=user_ids)
+
+    async def invalidate_principal(self, user_id: int):
+        # Called whenever a user's row changes; reaches every worker's principal cache
+        principal_cache.invalidate(user_id)
+        await self._publish("invalidate_principal", None, user_id=user_id)
+
+    async def _publish(self, op: str, frame: Frame, **fields):
+        # Frames cross the backplane as JSON text whatever the local sockets speak
+        frame_text = frame.json if frame is not None else None
+        await self.backplane.publish({"origin": self.worker_id, "op": op, "frame": frame_text, **fields})
     
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+    async def connect(self, websocket: WebSocket, user_id: int) -> Connection:
+        # JSON text frames by default; "msgpack" subprotocol for binary clients
+        codec, subprotocol = negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(websocket, user_id, codec=codec)
+        connection.start()
+        self.registry.add(connection)
+        return connection
     
     def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-            if len(self.active_connections[user_id]) == 0:
-                del self.active_connections[user_id]
-        
-        # Cleanup room subscriptions
-        for room_id in list(self.room_subscribers.keys()):
-            if user_id in self.room_subscribers[room_id]:
-                try:
-                    self.room_subscribers[room_id].discard(user_id)
-                    if not self.room_subscribers[room_id]:
-                        del self.room_subscribers[room_id]
-                except KeyError:
-                    pass
+        connection = self.registry.find(websocket, user_id)
+        if connection is None:
+            return
+        connection.stop()
+        # Room subscriptions are dropped once the user's last connection is gone
+        self.registry.remove(connection)
     
     def join_room(self, room_id: int, user_id: int):
-        if room_id not in self.room_subscribers:
-            self.room_subscribers[room_id] = set()
-        self.room_subscribers[room_id].add(user_id)
+        self.registry.join(room_id, user_id)
     
     def leave_room(self, room_id: int, user_id: int):
-        if room_id in self.room_subscribers:
-            self.room_subscribers[room_id].discard(user_id)
+        self.registry.leave(room_id, user_id)
+
+    def _deliver(self, connection: Connection, frame: Frame, priority: bool = False):
+        # Enqueue only; the connection's writer task does the actual send
+        if connection.send_frame(frame, priority) or connection.closed:
+            return
+        # Queue full: slow consumer
+        if SLOW_CONSUMER_POLICY == "drop":
+            return
+        print(f"Disconnecting slow consumer (user {connection.user_id}, {connection.dropped_frames} dropped)")
+        EVICTIONS.inc(1, ("slow_consumer",))
+        connection.close(SLOW_CONSUMER_CLOSE_CODE)
+        self.disconnect(connection.websocket, connection.user_id)
+
+    def _send_frame_to_user(self, user_id: int, frame: Frame, priority: bool = False) -> int:
+        # Send to all connections for this user (e.g. mobile + desktop)
+        # Iterate over a copy since a slow consumer may be evicted mid-loop
+        connections = self.registry.user_connections(user_id)[:]
+        for connection in connections:
+            self._deliver(connection, frame, priority)
+        return len(connections)
     
-    async def send_to_user(self, user_id: int, message: dict):
-        if user_id in self.active_connections:
-            # Send to all connections for this user (e.g. mobile + desktop)
-            # Iterate over a copy to avoid modification during iteration
-            for connection in self.active_connections[user_id][:]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    pass
+    async def send_frame_to_users(self, user_ids: List[int], frame: Frame):
+        for user_id in user_ids:
+            self._send_frame_to_user(user_id, frame)
+        if user_ids:
+            await self._publish("users", frame, user_ids=user_ids)
+
+    async def send_to_user(self, user_id: int, message: dict, priority: bool = False):
+        frame = encode_frame(message)
+        self._send_frame_to_user(user_id, frame, priority)
+        await self._publish("users", frame, user_ids=[user_id], priority=priority)
     
-    async def send_personal_message(self, message: dict, user_id: int):
+    async def send_personal_message(self, message: dict, user_id: int, priority: bool = False):
         # Alias for send_to_user
-        await self.send_to_user(user_id, message)
+        await self.send_to_user(user_id, message, priority)
 
-    async def send_to_user_except(self, user_id: int, message: dict, exclude_ws: WebSocket):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id][:]:
-                if connection != exclude_ws:
-                    try:
-                        await connection.send_json(message)
-                    except:
-                        pass
+    async def send_to_connection(self, connection_id: str, message: dict, priority: bool = False):
+        # One specific socket, wherever it lives
+        frame = encode_frame(message)
+        connection = self.registry.get(connection_id)
+        if connection is not None:
+            self._deliver(connection, frame, priority)
+        else:
+            await self._publish("connection", frame, connection_id=connection_id, priority=priority)
+
+    async def send_to_user_except(self, user_id: int, message: dict, exclude_ws: WebSocket, priority: bool = False):
+        frame = encode_frame(message)
+        for connection in self.registry.user_connections(user_id)[:]:
+            if connection.websocket is not exclude_ws:
+                self._deliver(connection, frame, priority)
+        # The excluded socket lives on this worker, so other workers reach all of the user's sockets
+        await self._publish("users", frame, user_ids=[user_id], priority=priority)
+
+    def _fan_out_room(self, room_id: int, frame: Frame, exclude_user_id: int = None):
+        started = time.perf_counter()
+        recipients = 0
+        for user_id in list(self.registry.subscribers(room_id)):
+            if exclude_user_id and user_id == exclude_user_id:
+                continue
+            recipients += self._send_frame_to_user(user_id, frame)
+        FANOUT_RECIPIENTS.observe(recipients)
+        FANOUT_SECONDS.observe(time.perf_counter() - started)
 
     async def broadcast_to_room(self, room_id: int, message: dict, exclude_user_id: int = None):
-        if room_id in self.room_subscribers:
-            for user_id in list(self.room_subscribers[room_id]):
-                if exclude_user_id and user_id == exclude_user_id:
-                    continue
-                await self.send_to_user(user_id, message)
-                
-    async def notify_friends_status(self, user_id: int, status: str, db: Session):
-        # Find friends
-        from models import FriendRequest, FriendRequestStatus
-        from sqlalchemy import or_, and_
-        
-        def get_friends():
-            return db.query(User).join(
-                FriendRequest,
-                or_(
-                    and_(FriendRequest.sender_id == User.id, FriendRequest.receiver_id == user_id),
-                    and_(FriendRequest.receiver_id == User.id, FriendRequest.sender_id == user_id)
-                )
-            ).filter(
-                FriendRequest.status == FriendRequestStatus.ACCEPTED
-            ).all()
-        
-        # Run DB query in thread
-        friends = await asyncio.to_thread(get_friends)
-        
-        message = {
-            "type": "user_status",
-            "user_id": user_id,
-            "status": status, # "online", "offline"
-            "last_seen": datetime.utcnow().isoformat()
-        }
-        
-        for friend in friends:
-            await self.send_to_user(friend.id, message)
+        # Encode once, then fan-out only enqueues, so this never waits on a socket
+        frame = self.replay.record(room_id, message, exclude_user_id)
+        self._fan_out_room(room_id, frame, exclude_user_id)
+        await self._publish("room", frame, room_id=room_id, exclude_user_id=exclude_user_id)
 
 manager = ConnectionManager()
+presence = PresenceEngine(manager)
+read_watermarks = ReadWatermarks(manager)
+calls = CallRegistry(manager)
 
-# Helper for non-blocking DB save
-def save_message_to_db(db: Session, content: str, sender_id: int, room_id: int, msg_type: str):
-    new_message = Message(
-        content=content,
-        sender_id=sender_id,
-        room_id=room_id,
-        message_type=msg_type,
-    )
-    db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
-    return new_message
+SIGNALING_TYPES = {"call_offer", "call_answer", "call_reject", "call_end", "ice_candidate"}
+
+def _queue_depths(reduce) -> dict:
+    connections = manager.registry.all_connections()
+    return {
+        ("normal",): reduce([len(c.queue) for c in connections] or [0]),
+        ("priority",): reduce([len(c.priority_queue) for c in connections] or [0]),
+    }
+
+# Read from live state at scrape time, so they cost nothing between scrapes
+metrics.collected("webchat_ws_connections", "Open WebSocket connections", lambda: len(manager.registry.by_id))
+metrics.collected("webchat_ws_users", "Users with at least one open connection", lambda: len(manager.registry.connections))
+metrics.collected("webchat_ws_rooms", "Rooms with at least one subscriber", lambda: len(manager.registry.room_subscribers))
+metrics.collected("webchat_ws_room_subscriptions", "Room subscriptions (sum of subscribers over rooms)",
+                  lambda: sum(len(s) for s in manager.registry.room_subscribers.values()))
+metrics.collected("webchat_ws_room_subscribers_max", "Subscribers of the largest room",
+                  lambda: max((len(s) for s in manager.registry.room_subscribers.values()), default=0))
+metrics.collected("webchat_ws_send_queue_frames", "Frames waiting in outbound queues", lambda: _queue_depths(sum),
+                  labelnames=("lane",))
+metrics.collected("webchat_ws_send_queue_frames_max", "Deepest outbound queue", lambda: _queue_depths(max),
+                  labelnames=("lane",))
+metrics.collected("webchat_ws_throttled_frames_total", "Inbound frames over their rate limit",
+                  lambda: {tuple(key.split(":")): value for key, value in rate_limiter.throttled.items()},
+                  kind="counter", labelnames=("category", "outcome"))
+
+async def is_room_member(room_id: int, user_id: int) -> bool:
+    # Permission check for the hot path: served from membership_cache, DB only on a miss
+    cached = membership_cache.get(room_id, user_id)
+    if cached is not None:
+        return cached
+    generation = membership_cache.generation
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(RoomMember.user_id).where(
+            RoomMember.room_id == room_id,
+            RoomMember.user_id == user_id
+        ))
+        is_member = result.first() is not None
+
+    membership_cache.set(room_id, user_id, is_member, generation)
+    return is_member
 
 @router.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket, token: str):
-    # Run DB creation in thread if it were expensive, but SessionLocal is cheap
-    db = SessionLocal()
+    # DB work uses short-lived async sessions per operation; nothing is held open per socket
     user = None
+    connection = None
+    limiter = None
     
     try:
-        from jose import jwt
-        from auth import SECRET_KEY, ALGORITHM
-        
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username = payload.get("sub")
-            if username is None:
-                 await websocket.close(code=1008)
-                 return
-            
-            # Non-blocking user fetch
-            user = await asyncio.to_thread(
-                lambda: db.query(User).filter(User.username == username).first()
-            )
-            
+            # Same principal cache as the HTTP endpoints; no DB round trip on a hit
+            user = await principal_from_token(token)
         except Exception:
              await websocket.close(code=1008)
              return
@@ -155,53 +298,62 @@ async def websocket_chat(websocket: WebSocket, token: str):
             await websocket.close(code=1008)
             return
         
-        await manager.connect(websocket, user.id)
+        connection = await manager.connect(websocket, user.id)
+        # Token buckets for this socket, sharing per-user buckets with the user's other sockets
+        limiter = rate_limiter.acquire(user.id)
         
-        # Update last seen and notify friends
-        # Run in background to be instant
-        def update_status():
-            user.last_seen = datetime.utcnow()
-            user.is_active = True
-            db.commit()
-            
-        await asyncio.to_thread(update_status)
-        asyncio.create_task(manager.notify_friends_status(user.id, "online", db))
+        # Presence updates last_seen and tells friends, debounced and only on real transitions
+        await presence.session_opened(user.id)
         
         # Send connection confirmation
-        await websocket.send_json({
+        # Replies go through the connection's queue so they stay ordered with broadcasts
+        connection.send({
             "type": "connected",
             "user_id": user.id,
-            "username": user.username
+            "username": user.username,
+            # Room seq numbers are issued per worker; resume needs to know whose they are
+            "epoch": manager.worker_id
         })
         
         while True:
-            data = await websocket.receive_json()
+            # JSON text or MessagePack binary, whichever the client sent
+            data = await receive_message(websocket)
+            connection.touch()
             message_type = data.get("type")
 
+            retry_after = await limiter.admit(message_type)
+            if retry_after is not None:
+                # Over the limit: only chat frames are answered so the client can retry later
+                if message_type == "message":
+                    connection.send({
+                        "type": "rate_limited",
+                        "message_type": message_type,
+                        "retry_after": round(retry_after, 3),
+                        "correlation_id": data.get("correlation_id")
+                    })
+                continue
+
             if message_type == "ping":
-                await websocket.send_json({"type": "pong"})
+                connection.send({"type": "pong"})
+                continue
+
+            if message_type == "heartbeat_ack":
+                # Answer to the sweeper's heartbeat; touch() above is all it needs
                 continue
             
             if message_type == "join_room":
                 try:
                     room_id = int(data.get("room_id"))
-                    # SECURITY: Check database permission (Non-blocking)
-                    def check_member():
-                        return db.query(RoomMember).filter(
-                            RoomMember.room_id == room_id,
-                            RoomMember.user_id == user.id
-                        ).first()
-                    
-                    member = await asyncio.to_thread(check_member)
-                    
-                    if member:
+                    # SECURITY: Check membership (cached, DB on miss)
+                    if await is_room_member(room_id, user.id):
                         manager.join_room(room_id, user.id)
-                        await websocket.send_json({
+                        connection.send({
                             "type": "joined_room",
-                            "room_id": room_id
+                            "room_id": room_id,
+                            "seq": manager.replay.last_seq(room_id)
                         })
                     else:
-                        await websocket.send_json({
+                        connection.send({
                             "type": "error",
                             "message": "Access denied to room"
                         })
@@ -219,23 +371,14 @@ async def websocket_chat(websocket: WebSocket, token: str):
                 try:
                     room_id = int(data.get("room_id"))
                     # Double check permission
-                    def check_member_msg():
-                         return db.query(RoomMember).filter(
-                             RoomMember.room_id == room_id,
-                             RoomMember.user_id == user.id
-                         ).first()
-                    
-                    member = await asyncio.to_thread(check_member_msg)
-                    
-                    if not member:
+                    if not await is_room_member(room_id, user.id):
                          continue
 
                     content = data.get("content")
                     
-                    # Offload DB save
-                    new_message = await asyncio.to_thread(
-                        save_message_to_db, 
-                        db, content, user.id, room_id, data.get("message_type", "text")
+                    # Group-committed by the writer task; resolves once the batch is saved
+                    new_message = await message_writer.submit(
+                        content, user.id, room_id, data.get("message_type", "text")
                     )
                     
                     # Broadcast to room
@@ -261,7 +404,7 @@ async def websocket_chat(websocket: WebSocket, token: str):
                     # Send ACK if correlation_id is present
                     correlation_id = data.get("correlation_id")
                     if correlation_id:
-                         await websocket.send_json({
+                         connection.send({
                              "type": "message_ack",
                              "correlation_id": correlation_id,
                              "message_id": new_message.id
@@ -272,86 +415,194 @@ async def websocket_chat(websocket: WebSocket, token: str):
                     print(f"Error handling message: {e}")
                     continue
             
+            elif message_type == "resume":
+                # Reconnect catch-up: {"epoch": ..., "rooms": [{"room_id", "seq", "last_message_id"}]}
+                await resume_rooms(connection, user.id, data)
+
             elif message_type == "read_receipt":
-                # ... existing read receipt logic ...
-                pass
+                # Advance this member's read watermark; flushed and broadcast in batches
+                try:
+                    room_id = int(data.get("room_id"))
+                    message_id = int(data.get("message_id"))
+                except (ValueError, TypeError):
+                    continue
+                if await is_room_member(room_id, user.id):
+                    read_watermarks.advance(room_id, user.id, message_id)
 
             # --- WebRTC Signaling ---
-            elif message_type == "call_offer":
-                target_id = data.get("target_user_id")
-                await manager.send_personal_message({
-                    "type": "call_offer",
-                    "sender_id": user.id,
-                    "sdp": data.get("sdp")
-                }, target_id)
-                
-            elif message_type == "call_answer":
-                target_id = data.get("target_user_id")
-                await manager.send_personal_message({
-                    "type": "call_answer",
-                    "sender_id": user.id,
-                    "sdp": data.get("sdp")
-                }, target_id)
-                
-                # Notify other sessions of the answerer that they handled the call
-                await manager.send_to_user_except(user.id, {
-                    "type": "call_handled",
-                    "reason": "answered_elsewhere"
-                }, websocket)
-
-
-            elif message_type == "call_reject":
-                # User rejected the call
-                target_id = data.get("target_user_id")
-                # Notify caller
-                await manager.send_personal_message({
-                    "type": "call_rejected",
-                    "sender_id": user.id
-                }, target_id)
-
-                # Notify other sessions of the rejecter
-                await manager.send_to_user_except(user.id, {
-                    "type": "call_handled",
-                    "reason": "rejected_elsewhere"
-                }, websocket)
-
-            elif message_type == "call_end":
-                target_id = data.get("target_user_id")
-                # Notify the other party
-                await manager.send_personal_message({
-                    "type": "call_ended",
-                    "sender_id": user.id
-                }, target_id)
-                # Ensure other sessions of sender also reset
-                await manager.send_to_user_except(user.id, {
-                    "type": "call_handled",
-                    "reason": "ended_elsewhere"
-                }, websocket)
-
-            elif message_type == "ice_candidate":
-                target_id = data.get("target_user_id")
-                await manager.send_personal_message({
-                    "type": "ice_candidate",
-                    "sender_id": user.id,
-                    "candidate": data.get("candidate")
-                }, target_id)
+            elif message_type in SIGNALING_TYPES:
+                try:
+                    target_id = int(data.get("target_user_id"))
+                except (ValueError, TypeError):
+                    continue
+                await handle_signaling(message_type, data, user.id, target_id, connection)
     
     except WebSocketDisconnect:
-        if user:
-            manager.disconnect(websocket, user.id)
-            
-            async def set_offline():
-                user.last_seen = datetime.utcnow()
-                user.is_active = False # Mark as offline
-                db.commit()
-            
-            await asyncio.to_thread(set_offline)
-            await manager.notify_friends_status(user.id, "offline", db)
-            
+        pass
     except Exception as e:
         print(f"WebSocket error: {e}")
-        if user:
-            manager.disconnect(websocket, user.id)
     finally:
-        # Wrap db.close() just in case, though usually fast
-        await asyncio.to_thread(db.close)
+        if limiter is not None:
+            rate_limiter.release(limiter)
+        if connection is not None:
+            manager.disconnect(websocket, user.id)
+            await calls.drop_session(connection.id)
+            await presence.session_closed(user.id)
+
+async def resume_rooms(connection: Connection, user_id: int, data: dict):
+    # Replays what each room broadcast since the client's last seq: from the
+    # replay buffer while the gap is still buffered on this worker, otherwise
+    # the missed messages from the database
+    same_epoch = data.get("epoch") == manager.worker_id
+    for entry in data.get("rooms") or []:
+        try:
+            room_id = int(entry.get("room_id"))
+            seq = int(entry.get("seq") or 0)
+        except (ValueError, TypeError, AttributeError):
+            continue
+        if not await is_room_member(room_id, user_id):
+            connection.send({
+                "type": "error",
+                "message": "Access denied to room"
+            })
+            continue
+
+        frames = manager.replay.since(room_id, seq, user_id) if same_epoch else None
+        # Subscribe and read the buffer without yielding, so no live frame falls in between
+        manager.join_room(room_id, user_id)
+        baseline = manager.replay.last_seq(room_id)
+        if frames is not None:
+            source = "memory"
+            complete = all(connection.send_frame(frame) for frame in frames)
+            replayed = len(frames)
+        else:
+            # Live frames may arrive while we query; clients dedupe messages by id
+            source = "database"
+            complete, replayed = await replay_from_database(connection, room_id, entry.get("last_message_id"))
+
+        connection.send({
+            "type": "resumed",
+            "room_id": room_id,
+            "seq": baseline,
+            "source": source,
+            "replayed": replayed,
+            # False: the client must refetch this room's history over REST
+            "complete": complete
+        })
+
+async def replay_from_database(connection: Connection, room_id: int, last_message_id) -> tuple:
+    try:
+        last_message_id = int(last_message_id)
+    except (ValueError, TypeError):
+        return False, 0
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Message).where(
+                Message.room_id == room_id,
+                Message.id > last_message_id,
+                Message.is_deleted == False
+            ).options(
+                selectinload(Message.sender),
+                selectinload(Message.attachments)
+            ).order_by(Message.id).limit(REPLAY_DB_LIMIT + 1)
+        )
+        messages = result.scalars().all()
+
+    complete = len(messages) <= REPLAY_DB_LIMIT
+    messages = messages[:REPLAY_DB_LIMIT]
+    for sent, message in enumerate(messages):
+        if not connection.send({"type": "new_message", "message": message_payload(message)}):
+            return False, sent
+    return complete, len(messages)
+
+def message_payload(message: Message) -> dict:
+    # Same shape as the live new_message broadcasts
+    return {
+        "id": message.id,
+        "content": message.content,
+        "sender_id": message.sender_id,
+        "room_id": message.room_id,
+        "message_type": message.message_type,
+        "created_at": message.created_at.isoformat(),
+        "attachments": [{
+            "id": attachment.id,
+            "filename": attachment.filename,
+            "file_size": attachment.file_size,
+            "content_type": attachment.content_type
+        } for attachment in message.attachments],
+        "sender": {
+            "id": message.sender.id,
+            "username": message.sender.username,
+            "display_name": message.sender.display_name,
+            "avatar_url": message.sender.avatar_url
+        },
+    }
+
+async def relay_signal(sender_id: int, target_id: int, message: dict):
+    # High-priority lane; pinned to the target's socket in this call once known,
+    # otherwise (still ringing) to all of the target's sockets
+    session_id = calls.peer_session(sender_id, target_id)
+    if session_id is not None:
+        await manager.send_to_connection(session_id, message, priority=True)
+    else:
+        await manager.send_personal_message(message, target_id, priority=True)
+
+async def handle_signaling(message_type: str, data: dict, user_id: int, target_id: int, connection: Connection):
+    if message_type == "call_offer":
+        # Rings on every socket of the target; the caller is pinned to this socket
+        await calls.offer(user_id, connection.id, target_id)
+        await relay_signal(user_id, target_id, {
+            "type": "call_offer",
+            "sender_id": user_id,
+            "sdp": data.get("sdp")
+        })
+
+    elif message_type == "call_answer":
+        # The answering socket becomes the callee's session for the rest of the call
+        await calls.answer(user_id, connection.id, target_id)
+        await relay_signal(user_id, target_id, {
+            "type": "call_answer",
+            "sender_id": user_id,
+            "sdp": data.get("sdp")
+        })
+        
+        # Notify other sessions of the answerer that they handled the call
+        await manager.send_to_user_except(user_id, {
+            "type": "call_handled",
+            "reason": "answered_elsewhere"
+        }, connection.websocket, priority=True)
+
+    elif message_type == "call_reject":
+        # User rejected the call; notify caller
+        await relay_signal(user_id, target_id, {
+            "type": "call_rejected",
+            "sender_id": user_id
+        })
+        await calls.end(user_id, target_id)
+
+        # Notify other sessions of the rejecter
+        await manager.send_to_user_except(user_id, {
+            "type": "call_handled",
+            "reason": "rejected_elsewhere"
+        }, connection.websocket, priority=True)
+
+    elif message_type == "call_end":
+        # Notify the other party
+        await relay_signal(user_id, target_id, {
+            "type": "call_ended",
+            "sender_id": user_id
+        })
+        await calls.end(user_id, target_id)
+        # Ensure other sessions of sender also reset
+        await manager.send_to_user_except(user_id, {
+            "type": "call_handled",
+            "reason": "ended_elsewhere"
+        }, connection.websocket, priority=True)
+
+    elif message_type == "ice_candidate":
+        await relay_signal(user_id, target_id, {
+            "type": "ice_candidate",
+            "sender_id": user_id,
+            "candidate": data.get("candidate")
+        })
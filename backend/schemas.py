@@ -72,6 +72,37 @@ class RoomResponse(BaseModel):
     
     model_config = ConfigDict(from_attributes=True)
 
+# Inbox Schemas
+class InboxMember(BaseModel):
+    user_id: int
+    username: str
+    display_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+
+class InboxLastMessage(BaseModel):
+    id: int
+    # First INBOX_PREVIEW_CHARS characters only
+    content: Optional[str] = None
+    sender_id: int
+    message_type: str
+    created_at: datetime
+
+class InboxRoom(BaseModel):
+    id: int
+    name: Optional[str] = None
+    type: RoomType
+    # A few members (others before the caller) and the full count
+    members: List[InboxMember] = []
+    member_count: int
+    last_message: Optional[InboxLastMessage] = None
+    unread_count: int
+    last_read_at: Optional[datetime] = None
+
+class InboxPage(BaseModel):
+    # Most recently active first; pass next_cursor as cursor for the next page
+    rooms: List[InboxRoom]
+    next_cursor: Optional[str] = None
+
 # File Schemas
 class FileAttachmentResponse(BaseModel):
     id: int
@@ -110,12 +141,19 @@ class MessageResponse(BaseModel):
 class MessageWithSender(MessageResponse):
     sender: UserResponse
 
+class MessagePage(BaseModel):
+    # Newest first, except after_id pages which run oldest first.
+    # next_cursor goes in the same parameter for the next page; None at the end
+    messages: List[MessageWithSender]
+    next_cursor: Optional[int] = None
+
 # Read Receipt Schemas
 class ReadReceiptCreate(BaseModel):
     message_id: int
 
 class ReadReceiptResponse(BaseModel):
-    id: int
+    # Derived from the member's read watermark, so there is no receipt row id
+    id: Optional[int] = None
     message_id: int
     user_id: int
     read_at: datetime
@@ -0,0 +1,102 @@
+"""Materialized unread counters on room_members.
+
+RoomMember.unread_count is the number of messages from others, not deleted,
+newer than the member's read watermark (last_read_at). It is kept current by
+the code that writes messages and watermarks, so the inbox reads a badge count
+instead of counting messages:
+
+    increment_unread_counts()  after inserting messages (message_writer, file
+                               upload, sync), in the same transaction
+    watermark advance          read_receipts sets the count to what is left
+                               after the new watermark (recount_expression)
+    repair                     recompute_unread_counts() rebuilds the counters
+                               from messages; run it by hand if they drift:
+
+    python unread_counts.py              # every room
+    python unread_counts.py --room 12    # one room
+"""
+import argparse
+import os
+from typing import Iterable, List
+
+from dotenv import load_dotenv
+from sqlalchemy import func, or_, select, update
+
+from models import Message, RoomMember
+
+load_dotenv()
+
+# Rooms recounted per transaction by the repair job
+UNREAD_REPAIR_BATCH_ROOMS = int(os.getenv("UNREAD_REPAIR_BATCH_ROOMS", "500"))
+
+members = RoomMember.__table__
+
+
+def recount_expression(read_at=None):
+    # Unread messages of the member row being updated, after read_at (default: its own
+    # watermark, where NULL means nothing read). A range on ix_messages_room_created_id
+    if read_at is None:
+        condition = or_(members.c.last_read_at.is_(None), Message.created_at > members.c.last_read_at)
+    else:
+        condition = Message.created_at > read_at
+    return select(func.count()).select_from(Message).where(
+        Message.room_id == members.c.room_id,
+        Message.sender_id != members.c.user_id,
+        Message.is_deleted == False,
+        condition
+    ).correlate(members).scalar_subquery()
+
+
+def increment_statement(messages: List[Message]):
+    # One UPDATE for a whole batch: every member of the batch's rooms gains the new
+    # messages others sent after their watermark (backdated sync messages may not count)
+    new_messages = select(func.count()).select_from(Message).where(
+        Message.id.in_([message.id for message in messages]),
+        Message.room_id == members.c.room_id,
+        Message.sender_id != members.c.user_id,
+        or_(members.c.last_read_at.is_(None), Message.created_at > members.c.last_read_at)
+    ).correlate(members).scalar_subquery()
+    return update(members).where(
+        members.c.room_id.in_({message.room_id for message in messages})
+    ).values(unread_count=members.c.unread_count + new_messages)
+
+
+async def increment_unread_counts(db, messages: List[Message]):
+    # Call after the messages are flushed (ids assigned) and before the commit
+    if messages:
+        await db.execute(increment_statement(messages))
+
+
+def recompute_statement(room_ids: Iterable[int] = None):
+    statement = update(members).values(unread_count=recount_expression())
+    if room_ids is not None:
+        statement = statement.where(members.c.room_id.in_(list(room_ids)))
+    return statement
+
+
+def recompute_unread_counts(engine, room_ids: Iterable[int] = None) -> int:
+    # Repair: rebuild the counters from messages, a batch of rooms per transaction.
+    # Returns the number of rooms recounted
+    if room_ids is None:
+        with engine.connect() as conn:
+            room_ids = conn.execute(select(members.c.room_id).distinct()).scalars().all()
+    room_ids = sorted(set(room_ids))
+    for start in range(0, len(room_ids), UNREAD_REPAIR_BATCH_ROOMS):
+        with engine.begin() as conn:
+            conn.execute(recompute_statement(room_ids[start:start + UNREAD_REPAIR_BATCH_ROOMS]))
+    return len(room_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the unread counters on room_members")
+    parser.add_argument("--room", type=int, action="append", help="Only this room (repeatable)")
+    args = parser.parse_args()
+
+    from database import engine
+
+    rooms = recompute_unread_counts(engine, args.room)
+    print(f"Recounted unread messages in {rooms} rooms")
+
+
+if __name__ == "__main__":
+    main()
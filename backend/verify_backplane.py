@@ -0,0 +1,132 @@
+"""Check RedisBackplane against the pub/sub stand-in: publish, subscribe, reconnect.
+
+Starts pubsub_standin in-process on a free port and two RedisBackplane
+instances (two workers) on it, then checks that:
+
+- envelopes published by either worker reach the other one, in order;
+- both workers reconnect after the server drops every connection and comes
+  back on the same port, and delivery resumes in both directions;
+- stop() cancels the backplane's tasks.
+
+Envelopes published while the server is down are lost (the backplane is
+at-most-once, like Redis pub/sub), so after the restart the check only waits
+for delivery to resume.
+
+    python verify_backplane.py
+"""
+import asyncio
+import sys
+import time
+
+from backplane import RedisBackplane
+from pubsub_standin import PubSubStandin
+
+CHANNEL = "verify:ws"
+ENVELOPES = 200
+TIMEOUT = 10.0
+
+
+class Server:
+    # The stand-in plus the connections it has open, so they can all be dropped
+    def __init__(self):
+        self.standin = PubSubStandin()
+        self.connections = set()
+        self.server = None
+
+    async def _handle(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            await self.standin.handle(reader, writer)
+        finally:
+            self.connections.discard(writer)
+
+    async def start(self, port: int = 0) -> int:
+        self.standin = PubSubStandin()
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", port, reuse_address=True)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def drop(self):
+        self.server.close()
+        for writer in list(self.connections):
+            writer.close()
+        await self.server.wait_closed()
+        # Let the handlers see the closed connections and return
+        await wait_for(lambda: not self.connections)
+
+    def subscribers(self) -> int:
+        return len(self.standin.channels.get(CHANNEL.encode(), ()))
+
+
+async def wait_for(condition, timeout: float = TIMEOUT) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.02)
+    return condition()
+
+
+async def main():
+    server = Server()
+    port = await server.start()
+    url = f"redis://127.0.0.1:{port}"
+
+    received = {"a": [], "b": []}
+    workers = {name: RedisBackplane(url, CHANNEL) for name in received}
+    for name, backplane in workers.items():
+        await backplane.start(received[name].append)
+
+    failures = 0
+
+    def report(ok: bool, name: str):
+        nonlocal failures
+        print(f"{'ok  ' if ok else 'FAIL'}  {name}")
+        failures += not ok
+
+    report(await wait_for(lambda: server.subscribers() == 2), "both workers subscribe")
+
+    # Redis delivers to every subscriber, the publisher included; workers tell theirs apart by envelope
+    for i in range(ENVELOPES):
+        await workers["a"].publish({"from": "a", "n": i})
+    await workers["b"].publish({"from": "b", "n": 0})
+
+    def from_worker(name: str, sender: str) -> list:
+        return [envelope["n"] for envelope in received[name] if envelope.get("from") == sender]
+
+    report(await wait_for(lambda: len(from_worker("b", "a")) == ENVELOPES)
+           and from_worker("b", "a") == list(range(ENVELOPES)), f"{ENVELOPES} envelopes from a reach b in order")
+    report(await wait_for(lambda: from_worker("a", "b") == [0]), "an envelope from b reaches a")
+
+    # Drop the server and every connection, then bring it back on the same port
+    await server.drop()
+    await asyncio.sleep(0.2)
+    await server.start(port)
+    report(await wait_for(lambda: server.subscribers() == 2), "both workers resubscribe after the server restarts")
+
+    for sender, receiver in (("a", "b"), ("b", "a")):
+        # The publisher notices the dead connection on its first write after the drop
+        async def probe():
+            deadline = time.monotonic() + TIMEOUT
+            n = 0
+            while time.monotonic() < deadline:
+                await workers[sender].publish({"from": sender, "probe": n})
+                n += 1
+                if any(envelope.get("from") == sender and "probe" in envelope for envelope in received[receiver]):
+                    return True
+                await asyncio.sleep(0.1)
+            return False
+        report(await probe(), f"delivery from {sender} to {receiver} resumes after reconnect")
+
+    for backplane in workers.values():
+        tasks = list(backplane.tasks)
+        await backplane.stop()
+        report(all(task.done() for task in tasks) and not backplane.tasks, "stop() ends the backplane tasks")
+    await server.drop()
+
+    if failures:
+        sys.exit(1)
+    print("Redis backplane publishes, subscribes and reconnects")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""Check that a message history page costs at most three queries at any size.
+
+Seeds a scratch SQLite database with a room whose messages come from many
+senders and carry attachments, then calls GET /api/messages in-process for
+several page sizes and cursors, counting the SQL statements each request
+issues. Fails if a page needs more than MAX_QUERIES, if the count grows with
+the page size (an N+1), or if a non-member can read the room.
+
+    python verify_history_queries.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="verify_history_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch}/verify.db"
+
+import httpx
+from sqlalchemy import event
+
+from auth import create_access_token
+from database import AsyncSessionLocal, Base, async_engine, engine
+from membership_cache import membership_cache
+from migrate import run_migrations
+from models import FileAttachment, Message, Room, RoomMember, RoomType, User
+
+# Membership (on a cache miss), messages with their senders, attachments
+MAX_QUERIES = 3
+SENDERS = 20
+MESSAGES = 240
+
+
+async def seed():
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    async with AsyncSessionLocal() as db:
+        users = [User(username=f"verify{i}", email=f"verify{i}@example.com", hashed_password="x") for i in range(SENDERS + 1)]
+        db.add_all(users)
+        await db.flush()
+        room = Room(type=RoomType.GROUP, name="verify", created_by=users[0].id)
+        db.add(room)
+        await db.flush()
+        # The last user is not a member
+        db.add_all([RoomMember(room_id=room.id, user_id=user.id) for user in users[:SENDERS]])
+        for i in range(MESSAGES):
+            message = Message(room_id=room.id, sender_id=users[i % SENDERS].id, content=f"message {i}")
+            db.add(message)
+            await db.flush()
+            for n in range(i % 3):
+                db.add(FileAttachment(message_id=message.id, filename=f"f{i}-{n}.txt", file_path=f"f{i}-{n}.txt",
+                                      file_size=1, content_type="text/plain"))
+        await db.commit()
+        return room.id, users[0], users[SENDERS]
+
+
+def token_for(user) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.username, 'uid': user.id})}"}
+
+
+async def main():
+    from main import app
+
+    room_id, member, outsider = await seed()
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    failures = 0
+    counts = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://verify") as client:
+        headers = token_for(member)
+        # Identify the caller once so the principal cache is warm, as it is for a live client
+        await client.get("/api/users/me", headers=headers)
+
+        cases = [(f"limit={limit}", f"limit={limit}") for limit in (1, 10, 50, 100)]
+        first_page = (await client.get(f"/api/messages?room_id={room_id}&limit=100", headers=headers)).json()
+        cursor = first_page["next_cursor"]
+        cases += [("before_id page of 100", f"limit=100&before_id={cursor}"),
+                  ("after_id page of 50", f"limit=50&after_id={first_page['messages'][-1]['id'] - 60}")]
+
+        for name, params in cases:
+            for cache in ("cold", "warm"):
+                if cache == "cold":
+                    membership_cache.clear()
+                statements.clear()
+                response = await client.get(f"/api/messages?room_id={room_id}&{params}", headers=headers)
+                page = response.json()
+                count = len(statements)
+                counts[(name, cache)] = count
+                ok = response.status_code == 200 and count <= MAX_QUERIES
+                # Every message carries its sender and exactly its own attachments
+                for message in page.get("messages", []):
+                    expected = {f"f{message['content'].split()[-1]}-{n}.txt" for n in range(int(message["content"].split()[-1]) % 3)}
+                    if message["sender"]["id"] != message["sender_id"] or {a["filename"] for a in message["attachments"]} != expected:
+                        ok = False
+                print(f"{'ok  ' if ok else 'FAIL'}  {name:<22} membership cache {cache}: {count} queries,"
+                      f" {len(page.get('messages', []))} messages")
+                failures += not ok
+
+        if len({count for (name, cache), count in counts.items() if cache == "cold"}) > 1:
+            print("FAIL  query count depends on the page size")
+            failures += 1
+
+        response = await client.get(f"/api/messages?room_id={room_id}", headers=token_for(outsider))
+        ok = response.status_code == 403
+        print(f"{'ok  ' if ok else 'FAIL'}  non-member gets {response.status_code}")
+        failures += not ok
+
+    # Pooled aiosqlite connections run on threads that would keep the process alive
+    await async_engine.dispose()
+    if failures:
+        sys.exit(1)
+    print(f"History pages stay within {MAX_QUERIES} queries")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
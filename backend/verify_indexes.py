@@ -0,0 +1,167 @@
+"""Check that every hot query is served by an index.
+
+Builds a scratch database shaped like one created before the index migration
+(old single-column indexes, none of the composites), runs the migrations the
+way startup does, then asks the planner for each hot query and fails if any of
+them scans a table or sorts history rows instead of reading them in index order.
+
+    python verify_indexes.py
+    python verify_indexes.py --url postgresql://user:pw@localhost/verify_webchat
+
+With --url the tables are dropped and recreated, so use a throwaway database.
+Postgres runs with enable_seqscan=off so that an empty table still shows which
+index would be used.
+"""
+import argparse
+import re
+import sys
+import tempfile
+
+from sqlalchemy import and_, func, or_, select, text, tuple_
+
+from database import Base, build_engine
+from migrate import run_migrations, schema_migrations
+from models import FileAttachment, FriendRequest, FriendRequestStatus, Message, ReadReceipt, Room, RoomMember, RoomType
+
+# Names of the indexes migration 0001 creates, and what the schema had before it
+NEW_INDEXES = [
+    "ix_messages_room_created_id", "ix_messages_room_id_id", "ix_messages_sender_room",
+    "ix_room_members_user_room", "ix_file_attachments_message_id", "uq_read_receipts_message_user",
+    "ix_friend_requests_pair_status", "ix_friend_requests_receiver_status",
+]
+LEGACY_INDEXES = [
+    "CREATE INDEX ix_messages_room_id ON messages (room_id)",
+    "CREATE INDEX ix_messages_created_at ON messages (created_at)",
+]
+
+TABLES = {table.name for table in Base.metadata.sorted_tables}
+
+
+def _anchor(message_id: int):
+    return select(Message.created_at).where(Message.id == message_id, Message.room_id == 1).scalar_subquery()
+
+
+def hot_queries():
+    # (name, statement, must come back in index order) - mirrors the routes' queries
+    return [
+        ("room history", select(Message).where(Message.room_id == 1, Message.is_deleted == False)
+            .order_by(Message.created_at.desc(), Message.id.desc()).limit(51), True),
+        ("room history before a cursor", select(Message).where(
+            Message.room_id == 1, Message.is_deleted == False,
+            tuple_(Message.created_at, Message.id) < tuple_(_anchor(40), 40),
+        ).order_by(Message.created_at.desc(), Message.id.desc()).limit(51), True),
+        ("room history after a cursor", select(Message).where(
+            Message.room_id == 1, Message.is_deleted == False,
+            tuple_(Message.created_at, Message.id) > tuple_(_anchor(40), 40),
+        ).order_by(Message.created_at, Message.id).limit(51), True),
+        ("resume from message id", select(Message).where(Message.room_id == 1, Message.id > 10, Message.is_deleted == False)
+            .order_by(Message.id).limit(500), True),
+        ("attachments of messages", select(FileAttachment).where(FileAttachment.message_id.in_([1, 2, 3])), False),
+        ("membership check", select(RoomMember.user_id).where(RoomMember.room_id == 1, RoomMember.user_id == 2), False),
+        ("rooms of a user", select(Room).join(RoomMember).where(RoomMember.user_id == 1), False),
+        ("room members", select(RoomMember).where(RoomMember.room_id == 1), False),
+        ("inbox: last message of a room", select(Message.id).where(Message.room_id == 1, Message.is_deleted == False)
+            .order_by(Message.created_at.desc(), Message.id.desc()).limit(1), True),
+        ("unread recount after a watermark", select(func.count()).where(
+            Message.room_id == 1, Message.sender_id != 2, Message.is_deleted == False,
+            Message.created_at > "2024-01-01"), False),
+        ("inbox: member previews", select(RoomMember.room_id, RoomMember.user_id).where(RoomMember.room_id.in_([1, 2])), False),
+        ("watermarks of pending reads", select(RoomMember.room_id, RoomMember.user_id, RoomMember.last_read_at)
+            .where(RoomMember.room_id.in_([1, 3]), RoomMember.user_id.in_([2, 4])), False),
+        ("direct room between two users", select(Room.id).where(
+            Room.type == RoomType.DIRECT,
+            Room.id.in_(select(RoomMember.room_id).where(RoomMember.user_id == 1)),
+            Room.id.in_(select(RoomMember.room_id).where(RoomMember.user_id == 2)),
+        ), False),
+        ("read receipts of a message", select(ReadReceipt).where(ReadReceipt.message_id == 1), False),
+        ("friend ids (presence)", select(FriendRequest.sender_id, FriendRequest.receiver_id).where(
+            FriendRequest.status == FriendRequestStatus.ACCEPTED,
+            or_(FriendRequest.sender_id.in_([1, 2]), FriendRequest.receiver_id.in_([1, 2])),
+        ), False),
+        ("friend request between two users", select(FriendRequest).where(or_(
+            and_(FriendRequest.sender_id == 1, FriendRequest.receiver_id == 2),
+            and_(FriendRequest.sender_id == 2, FriendRequest.receiver_id == 1),
+        )), False),
+        ("received requests", select(FriendRequest).where(
+            FriendRequest.receiver_id == 1, FriendRequest.status == FriendRequestStatus.PENDING), False),
+        ("sent requests", select(FriendRequest).where(
+            FriendRequest.sender_id == 1, FriendRequest.status == FriendRequestStatus.PENDING), False),
+        ("sync: rooms posted in", select(Message.room_id).where(Message.sender_id == 1).distinct(), False),
+        ("sync: new messages", select(Message).where(
+            Message.room_id.in_([1, 2]), Message.created_at > "2024-01-01", Message.sender_id != 1), False),
+    ]
+
+
+def build_legacy_schema(engine):
+    Base.metadata.drop_all(bind=engine)
+    schema_migrations.drop(engine, checkfirst=True)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name in NEW_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        for statement in LEGACY_INDEXES:
+            conn.execute(text(statement))
+
+
+def explain(conn, statement) -> list:
+    compiled = statement.compile(conn.engine, compile_kwargs={"literal_binds": True})
+    if conn.dialect.name == "sqlite":
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+    return [row[0] for row in conn.execute(text(f"EXPLAIN {compiled}"))]
+
+
+def problems(dialect: str, plan: list, ordered: bool) -> list:
+    found = []
+    for line in plan:
+        if dialect == "sqlite":
+            # "SCAN messages" is a full table scan; SEARCH ... USING (COVERING) INDEX is what we want
+            match = re.match(r"SCAN (\w+)", line.strip())
+            if match and match.group(1) in TABLES:
+                found.append(line.strip())
+            if ordered and "TEMP B-TREE FOR ORDER BY" in line:
+                found.append(line.strip())
+        else:
+            if "Seq Scan" in line:
+                found.append(line.strip())
+            if ordered and re.search(r"\bSort\b", line):
+                found.append(line.strip())
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Throwaway database to check instead of a scratch SQLite file")
+    args = parser.parse_args()
+    url = args.url or f"sqlite:///{tempfile.mkdtemp(prefix='verify_indexes_')}/verify.db"
+
+    engine = build_engine(url)
+    build_legacy_schema(engine)
+    applied = run_migrations(engine)
+    if "0001_hot_path_indexes" not in applied:
+        print("FAIL  migration 0001_hot_path_indexes was not applied")
+        sys.exit(1)
+    if run_migrations(engine):
+        print("FAIL  migrations are not recorded as applied")
+        sys.exit(1)
+
+    failures = 0
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SET enable_seqscan = off"))
+        for name, statement, ordered in hot_queries():
+            plan = explain(conn, statement)
+            bad = problems(conn.dialect.name, plan, ordered)
+            print(f"{'FAIL' if bad else 'ok  '}  {name}")
+            for line in bad:
+                print(f"        {line}")
+            failures += bool(bad)
+    engine.dispose()
+
+    if failures:
+        print(f"{failures} hot queries are not index-backed")
+        sys.exit(1)
+    print("All hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
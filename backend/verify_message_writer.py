@@ -0,0 +1,123 @@
+"""Check that the message writer survives the death of its task.
+
+Runs a MessageWriter against a scratch SQLite database and checks that:
+
+- a submit() resolves with the saved message;
+- after the writer task is cancelled while idle, the next submit() resolves;
+- when the task dies in the middle of a batch, that batch's submitters get an
+  error instead of waiting forever, and the next submit() resolves;
+- messages queued behind a dead task are still saved by stop();
+- after stop(), submit() raises instead of silently restarting the writer.
+
+    python verify_message_writer.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="verify_writer_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch}/verify.db"
+
+import message_writer as writer_module
+from database import AsyncSessionLocal, Base, async_engine, engine
+from migrate import run_migrations
+from models import Message, Room, RoomMember, RoomType, User
+from message_writer import MessageWriter
+
+TIMEOUT = 5.0
+
+
+class WriterKilled(BaseException):
+    # Not an Exception, so _flush does not absorb it and the task dies
+    pass
+
+
+async def seed():
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    async with AsyncSessionLocal() as db:
+        user = User(username="verify", email="verify@example.com", hashed_password="x")
+        db.add(user)
+        await db.flush()
+        room = Room(type=RoomType.GROUP, name="verify", created_by=user.id)
+        db.add(room)
+        await db.flush()
+        db.add(RoomMember(room_id=room.id, user_id=user.id))
+        await db.commit()
+        return room.id, user.id
+
+
+async def main():
+    room_id, user_id = await seed()
+    writer = MessageWriter(window_ms=0)
+    writer.start()
+    failures = 0
+
+    def report(ok: bool, name: str):
+        nonlocal failures
+        print(f"{'ok  ' if ok else 'FAIL'}  {name}")
+        failures += not ok
+
+    async def submit(content: str):
+        return await asyncio.wait_for(writer.submit(content, user_id, room_id, "text"), TIMEOUT)
+
+    message = await submit("first")
+    report(isinstance(message, Message) and message.id is not None, "submit resolves with the saved message")
+
+    writer.task.cancel()
+    await asyncio.gather(writer.task, return_exceptions=True)
+    try:
+        message = await submit("after cancel")
+        report(message.content == "after cancel", "submit resolves after the writer task was cancelled")
+    except asyncio.TimeoutError:
+        report(False, "submit resolves after the writer task was cancelled")
+
+    # Kill the task from inside a batch
+    insert_batch = writer_module._insert_batch
+
+    async def dying_insert(rows):
+        raise WriterKilled()
+
+    writer_module._insert_batch = dying_insert
+    try:
+        await submit("lost")
+        report(False, "the batch in hand fails when the writer dies")
+    except RuntimeError:
+        report(True, "the batch in hand fails when the writer dies")
+    except asyncio.TimeoutError:
+        report(False, "the batch in hand fails when the writer dies (it hung)")
+    finally:
+        writer_module._insert_batch = insert_batch
+    await asyncio.gather(writer.task, return_exceptions=True)
+    try:
+        message = await submit("after crash")
+        report(message.content == "after crash", "submit resolves after the writer task crashed")
+    except asyncio.TimeoutError:
+        report(False, "submit resolves after the writer task crashed")
+
+    # Queued behind a dead task, then flushed by stop()
+    writer.task.cancel()
+    await asyncio.gather(writer.task, return_exceptions=True)
+    pending = asyncio.get_running_loop().create_future()
+    writer.queue.put_nowait(({"content": "queued", "sender_id": user_id, "room_id": room_id, "message_type": "text"}, pending))
+    await writer.stop()
+    report(pending.done() and not pending.exception(), "stop() saves messages queued behind a dead task")
+    await writer.stop()
+    report(writer.task is None, "stop() is idempotent")
+
+    try:
+        await submit("after stop")
+        report(False, "submit raises after stop()")
+    except RuntimeError:
+        report(writer.task is None, "submit raises after stop() and does not restart the writer")
+
+    # Pooled aiosqlite connections run on threads that would keep the process alive
+    await async_engine.dispose()
+    if failures:
+        sys.exit(1)
+    print("The message writer recovers from a dead task")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
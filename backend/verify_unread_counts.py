@@ -0,0 +1,151 @@
+"""Check that the materialized unread counters match a recount from messages.
+
+Seeds a scratch SQLite database with a few rooms, then drives every path that
+writes messages or watermarks in-process (batched WebSocket messages, file
+upload, offline sync with a backdated message, read watermark advances) and
+after each step compares RoomMember.unread_count with the count it stands for.
+Finally corrupts the counters and checks that the repair job restores them.
+
+    python verify_unread_counts.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+_scratch = tempfile.mkdtemp(prefix="verify_unread_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch}/verify.db"
+# Uploads are written relative to the working directory
+os.chdir(_scratch)
+
+import httpx
+from sqlalchemy import select, update
+
+from auth import create_access_token
+from database import AsyncSessionLocal, Base, async_engine, engine
+from message_writer import message_writer
+from migrate import run_migrations
+from models import Message, Room, RoomMember, RoomType, User
+from routers.websocket_router import read_watermarks
+from unread_counts import recompute_unread_counts, recount_expression
+
+USERS = 4
+
+
+async def seed():
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    async with AsyncSessionLocal() as db:
+        users = [User(username=f"verify{i}", email=f"verify{i}@example.com", hashed_password="x") for i in range(USERS)]
+        db.add_all(users)
+        await db.flush()
+        rooms = [Room(type=RoomType.GROUP, name=f"verify{r}", created_by=users[0].id) for r in range(2)]
+        db.add_all(rooms)
+        await db.flush()
+        # Room 0 has everyone, room 1 the first two users
+        db.add_all([RoomMember(room_id=rooms[0].id, user_id=user.id) for user in users])
+        db.add_all([RoomMember(room_id=rooms[1].id, user_id=user.id) for user in users[:2]])
+        await db.commit()
+        return [room.id for room in rooms], users
+
+
+async def mismatches() -> list:
+    members = RoomMember.__table__
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(
+            members.c.room_id, members.c.user_id, members.c.unread_count, recount_expression().label("expected")
+        ))
+        return [row for row in result if row.unread_count != row.expected]
+
+
+async def counters() -> dict:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(RoomMember.room_id, RoomMember.user_id, RoomMember.unread_count))
+        return {(row.room_id, row.user_id): row.unread_count for row in result}
+
+
+def token_for(user) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.username, 'uid': user.id})}"}
+
+
+async def main():
+    from main import app
+
+    (room, pair), users = await seed()
+    failures = 0
+
+    async def check(step: str):
+        nonlocal failures
+        bad = await mismatches()
+        print(f"{'FAIL' if bad else 'ok  '}  {step}")
+        for row in bad:
+            print(f"        room {row.room_id} user {row.user_id}: counter {row.unread_count}, recount {row.expected}")
+        failures += bool(bad)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://verify") as client:
+        # Concurrent submits land in one batch, across both rooms and several senders
+        saved = await asyncio.gather(*[
+            message_writer.submit(f"message {i}", users[i % 3].id, room if i % 4 else pair, "text")
+            for i in range(24)
+        ])
+        await check("batched messages")
+        if (await counters())[(room, users[3].id)] != sum(1 for m in saved if m.room_id == room):
+            print("FAIL  a member who never posted should count every message in the room")
+            failures += 1
+
+        response = await client.post(f"/files/upload?room_id={room}", headers=token_for(users[1]),
+                                     files={"file": ("notes.txt", b"hello", "text/plain")})
+        ok = response.status_code == 200
+        print(f"{'ok  ' if ok else 'FAIL'}  upload returns {response.status_code}")
+        failures += not ok
+        await check("file upload")
+
+        # A backdated offline message does not count for members who have read past it
+        async with AsyncSessionLocal() as db:
+            newest = (await db.execute(select(Message.id).where(Message.room_id == room).order_by(Message.id.desc()))).scalars().first()
+        read_watermarks.advance(room, users[3].id, newest)
+        await read_watermarks.flush()
+        await check("watermark advance to the newest message")
+        if (await counters())[(room, users[3].id)] != 0:
+            print("FAIL  reading the newest message leaves nothing unread")
+            failures += 1
+        response = await client.post("/api/sync", headers=token_for(users[2]), json={"messages": [
+            {"content": "written offline", "room_id": room, "message_type": "text",
+             "client_timestamp": (datetime.utcnow() - timedelta(days=1)).isoformat(), "temp_id": "t1"},
+            {"content": "written just now", "room_id": room, "message_type": "text",
+             "client_timestamp": datetime.utcnow().isoformat(), "temp_id": "t2"},
+        ]})
+        ok = response.status_code == 200
+        print(f"{'ok  ' if ok else 'FAIL'}  sync returns {response.status_code}")
+        failures += not ok
+        await check("offline sync")
+
+        # Reading part of the room leaves the rest unread
+        read_watermarks.advance(room, users[0].id, saved[len(saved) // 2].id)
+        await read_watermarks.flush()
+        await check("watermark advance to a message in the middle")
+
+        inbox = (await client.get("/rooms/inbox", headers=token_for(users[0]))).json()
+        expected = await counters()
+        ok = all(entry["unread_count"] == expected[(entry["id"], users[0].id)] for entry in inbox["rooms"])
+        print(f"{'ok  ' if ok else 'FAIL'}  inbox shows the counters")
+        failures += not ok
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(RoomMember).values(unread_count=99))
+        await db.commit()
+    rooms = recompute_unread_counts(engine)
+    await check(f"repair job ({rooms} rooms)")
+
+    await message_writer.stop()
+    # Pooled aiosqlite connections run on threads that would keep the process alive
+    await async_engine.dispose()
+    if failures:
+        sys.exit(1)
+    print("Unread counters match the messages")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+import json
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _dumps_json(message: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def _loads_json(data) -> dict:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Frame:
+    """One outbound message, encoded at most once per wire format.
+
+    A broadcast builds a single Frame and queues it for every recipient; JSON
+    and MessagePack sockets each trigger their own encoding the first time it
+    is needed and share it from then on. The JSON text is also what travels
+    over the backplane.
+    """
+
+    __slots__ = ("_message", "_json", "_msgpack")
+
+    def __init__(self, message: dict = None, json_text: str = None):
+        self._message = message
+        self._json = json_text
+        self._msgpack: Optional[bytes] = None
+
+    @classmethod
+    def from_json(cls, json_text: str) -> "Frame":
+        return cls(json_text=json_text)
+
+    @property
+    def message(self) -> dict:
+        if self._message is None:
+            self._message = _loads_json(self._json)
+        return self._message
+
+    @property
+    def json(self) -> str:
+        if self._json is None:
+            self._json = _dumps_json(self._message)
+        return self._json
+
+    @property
+    def msgpack(self) -> bytes:
+        if self._msgpack is None:
+            self._msgpack = msgpack.packb(self.message)
+        return self._msgpack
+
+
+class JsonCodec:
+    name = "json"
+
+    async def send(self, websocket: WebSocket, frame: Frame):
+        await websocket.send_text(frame.json)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    async def send(self, websocket: WebSocket, frame: Frame):
+        await websocket.send_bytes(frame.msgpack)
+
+
+JSON = JsonCodec()
+
+# Subprotocols we can speak, keyed by the Sec-WebSocket-Protocol token
+CODECS: Dict[str, object] = {"json": JSON}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+
+def negotiate(websocket: WebSocket):
+    # Returns (codec, subprotocol to accept). The first protocol the client
+    # offers that we support wins; clients that offer none get plain JSON.
+    offered: List[str] = websocket.scope.get("subprotocols", [])
+    for subprotocol in offered:
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec, subprotocol
+    return JSON, None
+
+
+def decode(data) -> dict:
+    # The payload is decoded by frame type, so a msgpack client may still send JSON text
+    if isinstance(data, str):
+        return _loads_json(data)
+    if msgpack is None:
+        raise ValueError("Binary frames need msgpack installed")
+    return msgpack.unpackb(data, raw=False)
+
+
+async def receive_message(websocket: WebSocket) -> dict:
+    # Drop-in for websocket.receive_json() that also accepts binary MessagePack frames
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    text = message.get("text")
+    return decode(text if text is not None else message["bytes"])
@@ -2,6 +2,7 @@ import { createContext, useContext, useEffect, useRef, useState, ReactNode } fro
 import { useAuth } from './AuthContext.tsx';
 import { API_ENDPOINTS } from './lib/api.ts';
 import { db } from './lib/db.ts';
+import { backfillRoom } from './lib/history.ts';
 
 type WSMessage = {
     type: string;
@@ -52,6 +53,10 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
     const reconnectAttemptsRef = useRef(0);
     const pingIntervalRef = useRef<number | null>(null);
 
+    // Reconnect resume: last seq seen per room, meaningful only on the server worker (epoch) that issued it
+    const epochRef = useRef<string | null>(null);
+    const roomSeqRef = useRef<Map<number, { seq: number; lastMessageId?: number }>>(new Map());
+
     const [onlineUsers, setOnlineUsers] = useState<Map<number, string>>(new Map());
 
     // Unified Call State
@@ -95,10 +100,43 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
                 try {
                     const data: WSMessage = JSON.parse(event.data);
 
+                    // Room broadcasts carry a seq; remember the latest per room
+                    if (typeof data.seq === 'number') {
+                        const roomId = Number(data.room_id ?? data.message?.room_id);
+                        if (roomId) {
+                            const state = roomSeqRef.current.get(roomId) || { seq: 0 };
+                            state.seq = data.seq;
+                            roomSeqRef.current.set(roomId, state);
+                        }
+                    }
+
                     if (data.type === 'pong') {
                         // Alive
+                    } else if (data.type === 'heartbeat') {
+                        // Server checks idle sockets; answer so we are not evicted
+                        ws.send(JSON.stringify({ type: 'heartbeat_ack' }));
                     } else if (data.type === 'connected') {
                         console.log('Connected as', data.username);
+                        // Catch up on rooms we were in before the reconnect
+                        if (epochRef.current && roomSeqRef.current.size > 0) {
+                            ws.send(JSON.stringify({
+                                type: 'resume',
+                                epoch: epochRef.current,
+                                rooms: Array.from(roomSeqRef.current.entries()).map(([roomId, state]) => ({
+                                    room_id: roomId,
+                                    seq: state.seq,
+                                    last_message_id: state.lastMessageId,
+                                })),
+                            }));
+                        }
+                        epochRef.current = data.epoch;
+                    } else if (data.type === 'resumed') {
+                        if (!data.complete) {
+                            // Gap too large to replay over the socket; fetch the rest over HTTP
+                            console.warn(`Room ${data.room_id} could not be fully resumed, backfilling`);
+                            backfillRoom(Number(data.room_id)).catch(err => console.error("History backfill failed:", err));
+                        }
+                        setLastUpdate(Date.now());
                     } else if (data.type === 'user_status') {
                         setOnlineUsers(prev => {
                             const newMap = new Map(prev);
@@ -109,10 +147,28 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
                             }
                             return newMap;
                         });
+                    } else if (data.type === 'user_status_batch') {
+                        // Several friends changed state within one presence window
+                        setOnlineUsers(prev => {
+                            const newMap = new Map(prev);
+                            for (const s of data.statuses) {
+                                if (s.status === 'online') {
+                                    newMap.set(s.user_id, 'online');
+                                } else {
+                                    newMap.delete(s.user_id);
+                                }
+                            }
+                            return newMap;
+                        });
                     } else if (data.type === 'new_message') {
                         const msg = data.message;
                         const correlationId = data.correlation_id;
 
+                        const roomState = roomSeqRef.current.get(Number(msg.room_id));
+                        if (roomState) {
+                            roomState.lastMessageId = Math.max(roomState.lastMessageId || 0, msg.id);
+                        }
+
                         // Deduplication: If we have a pending message with this correlationId (temp_id), remove it first
                         if (correlationId) {
                             try {
@@ -200,6 +256,9 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
                         }
                     } else if (data.type === 'message_ack') {
                         // Could update local message status to 'delivered'
+                    } else if (data.type === 'rate_limited') {
+                        // Server dropped the frame; the message stays pending locally
+                        console.warn(`Rate limited, retry after ${data.retry_after}s`);
                     }
                 } catch (err) {
                     console.error('Error processing WebSocket message:', err);
@@ -5,6 +5,7 @@ import { db } from '../lib/db';
 import { useLiveQuery } from 'dexie-react-hooks';
 import { FileUploader } from './FileUploader';
 import { fetchWithAuth, API_ENDPOINTS, API_URL } from '../lib/api';
+import { backfillRoom, loadOlderMessages } from '../lib/history';
 
 interface ChatRoomProps {
     roomId: number;
@@ -64,9 +65,30 @@ export default function ChatRoom({ roomId, onBack }: ChatRoomProps) {
         joinRoom(roomId);
     }, [roomId, joinRoom]);
 
+    // Catch up on anything sent while this room was not open
+    const [hasOlder, setHasOlder] = useState(true);
+    const [loadingOlder, setLoadingOlder] = useState(false);
+    useEffect(() => {
+        setHasOlder(true);
+        backfillRoom(roomId).catch(err => console.error("History backfill failed:", err));
+    }, [roomId]);
+
+    const handleLoadOlder = async () => {
+        setLoadingOlder(true);
+        try {
+            setHasOlder(await loadOlderMessages(roomId));
+        } catch (err) {
+            console.error("Failed to load older messages:", err);
+        } finally {
+            setLoadingOlder(false);
+        }
+    };
+
+    // Follow new messages at the bottom, but stay put when older ones are prepended
+    const newestMessageKey = messages?.length ? (messages[messages.length - 1].id ?? messages[messages.length - 1].temp_id) : undefined;
     useEffect(() => {
         messagesEndRef.current?.scrollIntoView({ behavior: 'auto' });
-    }, [messages?.length, roomId]);
+    }, [newestMessageKey, roomId]);
 
     const handleSend = async () => {
         if (!inputValue.trim()) return;
@@ -268,6 +290,16 @@ export default function ChatRoom({ roomId, onBack }: ChatRoomProps) {
             <div className="flex-1 overflow-y-auto saas-scrollbar flex flex-col px-4 pt-[70px] pb-4 space-y-6 scroll-smooth">
                 <div className="flex-1" />
 
+                {hasOlder && (
+                    <button
+                        onClick={handleLoadOlder}
+                        disabled={loadingOlder}
+                        className="self-center text-xs text-txt-tertiary hover:text-txt-primary transition-colors disabled:opacity-50"
+                    >
+                        {loadingOlder ? 'Loading…' : 'Load earlier messages'}
+                    </button>
+                )}
+
                 {messages?.map((msg, i) => {
                     const isOwn = Number(msg.sender_id) === Number(user?.id);
                     const prevMsg = messages[i - 1];
@@ -16,6 +16,8 @@ export const API_ENDPOINTS = {
 
     // Rooms
     getRooms: `${API_URL}/rooms/`,
+    getInbox: (cursor?: string, limit = 50) =>
+        `${API_URL}/rooms/inbox?limit=${limit}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`,
     getRoom: (roomId: number) => `${API_URL}/rooms/${roomId}`,
     createDM: (userId: number) => `${API_URL}/rooms/dm?target_user_id=${userId}`,
     createGroup: `${API_URL}/rooms/group`,
@@ -23,8 +25,11 @@ export const API_ENDPOINTS = {
     deleteRoom: (roomId: number) => `${API_URL}/rooms/${roomId}`,
 
     // Messages
-    getMessages: (roomId: number, skip = 0, limit = 50) =>
-        `${API_URL}/api/messages?room_id=${roomId}&skip=${skip}&limit=${limit}`,
+    // Keyset pages: pass the response's next_cursor back as the same cursor (before_id or after_id)
+    getMessages: (roomId: number, cursor: { beforeId?: number; afterId?: number } = {}, limit = 50) =>
+        `${API_URL}/api/messages?room_id=${roomId}&limit=${limit}` +
+        (cursor.beforeId !== undefined ? `&before_id=${cursor.beforeId}` : '') +
+        (cursor.afterId !== undefined ? `&after_id=${cursor.afterId}` : ''),
     editMessage: (id: number) => `${API_URL}/messages/${id}`,
     markRead: (messageId: number) => `${API_URL}/api/messages/${messageId}/read`,
     getReadReceipts: (messageId: number) => `${API_URL}/api/messages/${messageId}/read-receipts`,
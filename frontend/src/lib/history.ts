@@ -0,0 +1,68 @@
+import { db, Message } from './db';
+import { fetchWithAuth, API_ENDPOINTS } from './api';
+
+// Room history from GET /api/messages (keyset pages) into IndexedDB.
+// Only server-confirmed rows have server ids; pending local rows are skipped when
+// picking cursors.
+
+const PAGE_SIZE = 50;
+
+interface MessagePage {
+    messages: any[];
+    next_cursor: number | null;
+}
+
+function toLocalMessage(msg: any): Message {
+    // Same shape the WebSocket new_message handler stores
+    return {
+        id: msg.id,
+        content: msg.content,
+        sender_id: msg.sender_id,
+        room_id: Number(msg.room_id),
+        message_type: msg.message_type || 'text',
+        created_at: new Date(msg.created_at),
+        updated_at: new Date(msg.updated_at || msg.created_at),
+        is_deleted: false,
+        is_edited: msg.is_edited,
+        status: 'synced',
+        sender: msg.sender,
+        attachments: msg.attachments || []
+    };
+}
+
+async function syncedMessages(roomId: number): Promise<Message[]> {
+    const rows = await db.messages.where('room_id').equals(roomId).sortBy('created_at');
+    return rows.filter(m => m.status === 'synced' && m.id !== undefined);
+}
+
+async function fetchPage(roomId: number, cursor: { beforeId?: number; afterId?: number }): Promise<MessagePage> {
+    const page: MessagePage = await fetchWithAuth(API_ENDPOINTS.getMessages(roomId, cursor, PAGE_SIZE));
+    await db.messages.bulkPut(page.messages.map(toLocalMessage));
+    return page;
+}
+
+// One page older than the oldest message we have. Resolves to false once the start of the room is reached.
+export async function loadOlderMessages(roomId: number): Promise<boolean> {
+    const synced = await syncedMessages(roomId);
+    const oldest = synced[0];
+    const page = await fetchPage(roomId, oldest ? { beforeId: oldest.id } : {});
+    return page.next_cursor !== null;
+}
+
+// Fill the gap between the newest message we have and now (after being offline, or when a
+// WebSocket resume could not replay everything). Empty rooms just get their latest page.
+export async function backfillRoom(roomId: number): Promise<void> {
+    const synced = await syncedMessages(roomId);
+    const newest = synced[synced.length - 1];
+    if (!newest) {
+        await fetchPage(roomId, {});
+        return;
+    }
+
+    // Walk forward from what we have, so no hole is left in the middle; each page costs the same
+    let cursor: number | null = newest.id!;
+    while (cursor !== null) {
+        const page = await fetchPage(roomId, { afterId: cursor });
+        cursor = page.next_cursor;
+    }
+}